@@ -0,0 +1,129 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEPD:
+    """
+    Awaitable wrapper around an EPD driver.
+
+    Every call runs on a single dedicated worker thread, so SPI transfers stay
+    serialized and the busy waits in ReadBusy never block the event loop.
+    """
+
+    def __init__(self, epd):
+        self.epd = epd
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='epd')
+
+    async def call(self, func, *args):
+        """Run func(*args) on the EPD worker thread"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def init(self):
+        return await self.call(self.epd.init)
+
+    async def init_fast(self):
+        return await self.call(self.epd.init_fast)
+
+    async def init_part(self):
+        return await self.call(self.epd.init_part)
+
+    async def init_4Gray(self):
+        return await self.call(self.epd.init_4Gray)
+
+    async def display(self, buffer):
+        return await self.call(self.epd.display, buffer)
+
+    async def display_Partial(self, buffer, x_start, y_start, x_end, y_end):
+        return await self.call(self.epd.display_Partial, buffer, x_start, y_start, x_end, y_end)
+
+    async def display_4Gray(self, buffer):
+        return await self.call(self.epd.display_4Gray, buffer)
+
+    async def Clear(self):
+        return await self.call(self.epd.Clear)
+
+    async def sleep(self):
+        return await self.call(self.epd.sleep)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncDisplayManager:
+    """
+    Pipelines a DisplayManager so the next frame is drawn while the panel is
+    still refreshing the previous one.
+
+    A refresh cycle then costs max(render, refresh) instead of their sum: the
+    packed buffer handed to the panel is independent of the manager's image, so
+    drawing can start again as soon as the transfer has been queued.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.epd = AsyncEPD(manager.epd) if not manager.dev_mode else None
+        self._render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+        self._pending_refresh = None
+
+    def _render(self):
+        # Runs on the render thread: draw the frame and pack it for the panel
+        self.manager.draw_frame()
+        if self.manager.dev_mode:
+            self.manager.save_display_preview(self.manager.preview_path)
+            return None
+        return self.manager.epd.getbuffer(self.manager.image)
+
+    async def render_frame(self):
+        """Draw the next frame off the event loop and return its packed buffer"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._render_executor, self._render)
+
+    async def refresh(self):
+        """
+        Render a frame and start pushing it to the panel.
+
+        Returns as soon as the new refresh has been queued; the previous refresh,
+        if still running, is awaited only after the new frame has been drawn.
+        """
+        buffer = await self.render_frame()
+        await self.wait_refresh()
+        if buffer is not None:
+            self._pending_refresh = asyncio.ensure_future(self.epd.call(self.manager.present_frame, buffer))
+
+    async def wait_refresh(self):
+        """Wait for the refresh in flight, if any, to finish"""
+        pending, self._pending_refresh = self._pending_refresh, None
+        if pending is not None:
+            await pending
+
+    async def run(self, interval, cycles=None):
+        """
+        Refresh every `interval` seconds, `cycles` times (forever if None).
+
+        Args:
+            interval: Seconds between the start of consecutive refreshes
+            cycles: Number of refreshes to perform before returning
+        """
+        loop = asyncio.get_event_loop()
+        count = 0
+        try:
+            while cycles is None or count < cycles:
+                started = loop.time()
+                await self.refresh()
+                count += 1
+                logger.debug("Refresh %d queued after %.3fs", count, loop.time() - started)
+                if cycles is not None and count >= cycles:
+                    break
+                await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+        finally:
+            await self.wait_refresh()
+
+    def close(self):
+        self._render_executor.shutdown(wait=True)
+        if self.epd is not None:
+            self.epd.close()
@@ -0,0 +1,372 @@
+"""
+Benchmarks for the render and transfer hot paths.
+
+Runs against the simulated panel, so no hardware is needed:
+
+    python -m display.benchmark --save bench_baseline.json
+    python -m display.benchmark --compare bench_baseline.json --threshold 10
+    python -m display.benchmark --startup --startup-budget-ms 400
+    python -m display.benchmark --check-memory
+    python -m display.benchmark --gpio
+
+On a Pi, --backend runs the same operations against the real panel through
+one of epd_config.BACKENDS instead, so the transfer paths of the spidev and
+native (DEV_Config.so) backends can be compared:
+
+    sudo python -m display.benchmark --backend spidev --only display Clear --save spidev.json
+    sudo python -m display.benchmark --backend native --only display Clear --compare spidev.json
+
+Each operation reports median/min wall time, the tracemalloc peak of a single
+call and the SPI bytes/transfers and GPIO writes it issued. --startup instead
+times a cold `main.py --dev` from process spawn to its first draw call and
+lists the slowest imports from `python -X importtime`. --check-memory fails
+if a refresh path allocates more than its MEMORY_BUDGET_KIB. --gpio toggles
+the DC pin through every GPIO backend that can be created on the machine
+(gpio_backends.GPIO_BACKENDS) and reports writes per second.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+import PIL
+
+from display.display_manager import DisplayManager, WIDTH, HEIGHT
+from display.epd_config import BACKENDS, RaspberryPi, buffer_address, create_backend
+from display.epd_simulator import SimulatedPanel
+from display.gpio_backends import GPIO_BACKENDS, create_gpio, measure_toggles
+from display.frame_store import FrameStore
+from display.icon_cache import IconCache
+
+logger = logging.getLogger(__name__)
+
+# Metrics compared against a baseline; the transfer counts are deterministic
+# and checked too, so a change that adds SPI traffic is flagged
+COMPARED_METRICS = ('wall_ms', 'peak_kib', 'spi_bytes', 'spi_calls', 'gpio_writes')
+
+# tracemalloc peak allowed per call, in KiB. A 1-bpp plane is 47 KiB and the
+# simulated panel keeps its own copy of each plane it receives, so a refresh
+# that sends one freshly built plane peaks around 94 KiB. Full-frame Python
+# int lists cost ~375 KiB each and fail these outright.
+MEMORY_BUDGET_KIB = {
+    'render_display': 160,
+    # getbuffer hands the caller a new plane on top of Pillow's packed bytes;
+    # the refresh path packs into a pooled one instead
+    'getbuffer': 150,
+    'getbuffer_into': 100,
+    'display': 100,
+    'display_4Gray': 260,
+    'Clear': 50,
+    # Handing a plane to the native backend must not copy it
+    'buffer_address': 1,
+}
+
+
+def sample_image(mode='1', size=(WIDTH, HEIGHT)):
+    """A deterministic test frame with text-like detail across the panel"""
+    image = Image.new(mode, size, 255)
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size[0], 40):
+        draw.line([(i, 0), (size[0] - i, size[1])], fill=0, width=2)
+    for i, fill in enumerate((0x00, 0x80, 0xC0)):
+        draw.rectangle((20 + i * 120, 20, 120 + i * 120, 120), fill=fill)
+    return image
+
+
+class BenchmarkSuite:
+    def __init__(self, workdir, spi_hz=None, backend=None):
+        self.workdir = Path(workdir)
+        # The hardware backend given by name, else the simulated panel
+        self.panel = create_backend(backend) if backend else SimulatedPanel(record=False, spi_hz=spi_hz)
+        self.manager = DisplayManager(dev_mode=False, epd_backend=self.panel,
+                                      frame_store=FrameStore(self.workdir / 'last_frame.bin'),
+                                      icon_cache=IconCache(self.workdir / 'icons'))
+        self.manager.post_refresh_delay = 0
+        self.epd = self.manager.epd
+        self.epd.init()
+
+        self.image = sample_image()
+        self.gray_image = sample_image('L')
+        # As bytes: the simulated panel snapshots every bytearray it is sent,
+        # a copy spidev does not make, which would count against display()
+        self.buffer = bytes(self.epd.getbuffer(self.image))
+        self.gray_buffer = bytes(self.epd.getbuffer_4Gray(self.gray_image))
+        self.icon = Path(__file__).resolve().parent / 'pic' / 'wi-cloud.bmp'
+
+    def operations(self):
+        """name -> zero-argument callable"""
+        manager, epd = self.manager, self.epd
+        preview = str(self.workdir / 'preview.png')
+
+        def render_display():
+            # Forget the last frame so every run pays for a full refresh
+            manager.frame_diff.last_frame = None
+            manager.render_display()
+
+        def display_streamed():
+            epd.stream_transfers = True
+            try:
+                epd.display(self.buffer)
+            finally:
+                epd.stream_transfers = False
+
+        def save_display_preview():
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.save_display_preview(preview)
+
+        return {
+            'render_display': render_display,
+            'draw_frame': manager.draw_frame,
+            'draw_wind_barb': lambda: manager.draw_wind_barb(60, 200, 65, 120, scale=2),
+            'scale_and_display_bmp': lambda: manager.scale_and_display_bmp(self.icon, position=(0, 50)),
+            'draw_current_icon': manager.draw_current_icon,
+            'save_display_preview': save_display_preview,
+            'getbuffer': lambda: epd.getbuffer(self.image),
+            'getbuffer_into': lambda: epd.getbuffer_into(self.image, epd.pool.frame(epd.plane_size)),
+            'getbuffer_4Gray': lambda: epd.getbuffer_4Gray(self.gray_image),
+            'display': lambda: epd.display(self.buffer),
+            'display_streamed': display_streamed,
+            'display_image': lambda: epd.display_image(self.image),
+            'display_4Gray': lambda: epd.display_4Gray(self.gray_buffer),
+            'Clear': epd.Clear,
+            'buffer_address': lambda: buffer_address(self.buffer),
+        }
+
+    def measure(self, func, repeat):
+        stats = self.panel.stats
+        start = stats.snapshot()
+        func()  # warm-up, also the run whose transfers are counted
+        transfers = stats.since(start)
+
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - t0) * 1000.0)
+
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'wall_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3),
+            'peak_kib': round(peak / 1024.0, 1),
+        }
+        result.update(transfers)
+        return result
+
+    def run(self, repeat=10, only=None):
+        results = {}
+        for name, func in self.operations().items():
+            if only and name not in only:
+                continue
+            results[name] = self.measure(func, repeat)
+            logger.info("%s: %s", name, results[name])
+        return results
+
+
+# Runs main.py --dev in a fresh interpreter and prints the wall-clock time at
+# the first DisplayManager.draw_frame call, then exits
+STARTUP_PROBE = """
+import runpy, sys, time
+sys.argv = ['main.py', '--dev']
+import display.display_manager as display_manager
+def probe(self):
+    print('FIRST_DRAW', time.time())
+    sys.exit(0)
+display_manager.DisplayManager.draw_frame = probe
+runpy.run_path('main.py', run_name='__main__')
+"""
+
+
+def measure_startup(repo_root, runs=5):
+    """
+    Returns:
+        (median milliseconds from spawn to first draw, [(import ms, module), ...] slowest first)
+    """
+    timings = []
+    imports = []
+    for _ in range(runs):
+        started = time.time()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_PROBE],
+                              cwd=repo_root, capture_output=True, text=True, check=True)
+        first_draw = next(float(line.split()[1]) for line in proc.stdout.splitlines()
+                          if line.startswith('FIRST_DRAW'))
+        timings.append((first_draw - started) * 1000.0)
+
+        imports = []
+        for line in proc.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, module = line.split('|')
+            if not module.startswith('  '):
+                imports.append((int(cumulative) / 1000.0, module.strip()))
+    imports.sort(reverse=True)
+    return statistics.median(timings), imports
+
+
+def measure_gpio(names, pin, toggles=100000):
+    """
+    Returns:
+        {backend name: toggles per second, or the reason it could not be created}
+    """
+    results = {}
+    for name in names:
+        try:
+            pins = create_gpio(name)
+        except Exception as e:
+            # Missing library, no GPIO chip, pins in use: report and move on
+            results[name] = f"unavailable ({type(e).__name__}: {e})"
+            continue
+        try:
+            results[name] = measure_toggles(pins.output(pin), toggles)
+        except Exception as e:
+            results[name] = f"failed ({type(e).__name__}: {e})"
+        finally:
+            pins.close()
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns:
+        List of (operation, metric, baseline value, new value, percent change)
+        for every metric that grew by more than `threshold` percent
+    """
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in old or metric not in new:
+                continue
+            if old[metric] == 0:
+                change = 0.0 if new[metric] == 0 else float('inf')
+            else:
+                change = (new[metric] - old[metric]) * 100.0 / old[metric]
+            if change > threshold:
+                regressions.append((name, metric, old[metric], new[metric], change))
+    return regressions
+
+
+def check_memory(results, budgets=MEMORY_BUDGET_KIB):
+    """
+    Returns:
+        List of (operation, peak KiB, budget KiB) for every operation over budget
+    """
+    return [(name, results[name]['peak_kib'], budget) for name, budget in budgets.items()
+            if name in results and results[name]['peak_kib'] > budget]
+
+
+def print_table(results):
+    columns = ('wall_ms', 'min_ms', 'peak_kib', 'spi_bytes', 'spi_calls', 'gpio_writes')
+    print(f"{'operation':<24}" + ''.join(f"{c:>13}" for c in columns))
+    for name, result in results.items():
+        print(f"{name:<24}" + ''.join(f"{result.get(c, ''):>13}" for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the render and transfer hot paths")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per operation")
+    parser.add_argument("--only", nargs='+', metavar='OPERATION', help="Run only these operations")
+    parser.add_argument("--save", metavar='PATH', help="Write the results to a baseline JSON file")
+    parser.add_argument("--compare", metavar='PATH', help="Compare against a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Percent increase over the baseline reported as a regression")
+    parser.add_argument("--spi-hz", type=int, default=None,
+                        help="Model SPI wire time at this clock (e.g. 4000000) instead of "
+                             "instantaneous transfers")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="Run against the panel through this hardware backend instead of the "
+                             "simulator")
+    parser.add_argument("--gpio", nargs='*', metavar='BACKEND', choices=sorted(GPIO_BACKENDS),
+                        help="Measure GPIO toggles per second instead, for these backends (default: all)")
+    parser.add_argument("--check-memory", action="store_true",
+                        help="Fail if a refresh path allocates more than its budget")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time a cold main.py --dev up to its first draw call instead")
+    parser.add_argument("--startup-budget-ms", type=float, default=None,
+                        help="Fail if the cold start to first draw takes longer than this")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.startup:
+        repo_root = Path(__file__).resolve().parent.parent
+        elapsed, imports = measure_startup(repo_root)
+        print(f"main.py --dev reaches its first draw after {elapsed:.1f} ms")
+        print("Slowest top-level imports:")
+        for ms, module in imports[:10]:
+            print(f"  {ms:8.1f} ms  {module}")
+        if args.startup_budget_ms is not None and elapsed > args.startup_budget_ms:
+            print(f"OVER BUDGET: {elapsed:.1f} ms > {args.startup_budget_ms:g} ms")
+            return 1
+        return 0
+
+    if args.gpio is not None:
+        results = measure_gpio(args.gpio or list(GPIO_BACKENDS), RaspberryPi.DC_PIN)
+        print(f"{'backend':<12}{'toggles/s':>14}")
+        for name, result in results.items():
+            if isinstance(result, str):
+                print(f"{name:<12}  {result}")
+            else:
+                print(f"{name:<12}{result:>14,.0f}")
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = BenchmarkSuite(workdir, args.spi_hz, args.backend).run(args.repeat, args.only)
+    print_table(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Baseline saved to: {args.save}")
+
+    status = 0
+    if args.check_memory:
+        over_budget = check_memory(results)
+        for name, peak, budget in over_budget:
+            print(f"OVER BUDGET {name}: {peak} KiB allocated, budget {budget} KiB")
+        if over_budget:
+            status = 1
+        else:
+            print("All refresh paths within their memory budgets")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name}.{metric}: {old} -> {new} (+{change:.1f}%)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold}%")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
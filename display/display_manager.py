@@ -3,23 +3,121 @@ import os
 import time
 from pathlib import Path
 import logging
-from PIL import Image,ImageDraw,ImageFont, ImageChops
+from typing import TYPE_CHECKING
+
+from display.frame_diff import FrameDiff
+from display.fonts import FONTS, text_size
+from display.frame_store import FrameStore
+from display.glyph_cache import GLYPHS
+from display.icon_atlas import IconAtlas
+from display.icon_cache import IconCache
+from display.metrics import METRICS, timed
+from display.sprite_cache import SpriteCache
+
+# Pillow is imported where it is first used, so importing this module (and
+# starting main.py) does not pay for it up front
+if TYPE_CHECKING:
+    from PIL import Image, ImageFont
 
 logger = logging.getLogger()
 
 WIDTH = 800
 HEIGHT = 480
 
+# Off-white that the preview uses for the panel's white, to look more like e-ink
+PREVIEW_PAPER = (245, 245, 240)
+# zlib level for PNG previews: 1 takes about half as long as Pillow's default
+# of 6, for a file that is still only a few KiB
+PREVIEW_COMPRESS_LEVEL = 1
+
+
+def save_preview(image, filename=None, scale=2, compress_level=PREVIEW_COMPRESS_LEVEL):
+    """
+    Save a preview of the e-ink display content to a file.
+
+    The format follows the file extension:
+        .pbm  raw 1-bit PBM at panel resolution
+        .bin  the packed 1-bpp buffer as EPD.getbuffer sends it to the panel
+        else  a PNG with a slight off-white tint, scaled up for visibility
+
+    Args:
+        image: PIL Image object containing the display content
+        filename: Path where to save the preview (default: creates a timestamped file)
+        scale: Integer scale factor for the PNG preview (default: 2)
+        compress_level: zlib level (0-9) for the PNG preview
+
+    Returns:
+        Path to the saved preview file
+    """
+    import datetime
+    from PIL import Image
+
+    if filename is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"eink_preview_{timestamp}.png"
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.pbm':
+        image.convert('1').save(filename, 'PPM')
+    elif suffix == '.bin':
+        # Panel RAM holds 1 for black, the inverse of Pillow's 1-bit pixels
+        with open(filename, 'wb') as f:
+            f.write(image.convert('1').tobytes('raw', '1;I'))
+    else:
+        if image.mode == '1':
+            # Two-entry palette instead of a per-pixel pass: black stays black,
+            # white becomes the off-white paper tone
+            preview_image = image.convert('L')
+            preview_image.putpalette((0, 0, 0) * 255 + PREVIEW_PAPER)
+        else:
+            preview_image = image.copy()
+
+        # Scale up for better visibility; nearest neighbour keeps the pixels crisp
+        if scale != 1:
+            width, height = preview_image.size
+            preview_image = preview_image.resize((width * scale, height * scale), Image.NEAREST)
+
+        preview_image.save(filename, 'PNG', compress_level=compress_level)
+    print(f"Preview saved to: {filename}")
+
+    return filename
+
+
 class DisplayManager:
-    def __init__(self, dev_mode=True):
+    def __init__(self, dev_mode=True, frame_store=None, epd_backend=None, metrics=None,
+                 icon_cache=None, icon_atlas=None):
         self.dev_mode = dev_mode
+        self.metrics = metrics if metrics is not None else METRICS
+        # Hardware backend handed to the EPD driver (RaspberryPi when None)
+        self.epd_backend = epd_backend
+        # Seconds render_display pauses after a refresh
+        self.post_refresh_delay = 20
+        # Where dev mode writes its preview; .pbm and .bin select the fast raw formats
+        self.preview_path = 'weather_preview.png'
+        # Pre-scaled 1-bit icons, so refreshes after the first skip decoding and resampling
+        self.icon_cache = icon_cache if icon_cache is not None else IconCache()
+        # Memory-mapped icons pre-rasterized at the layout sizes, when built
+        self.icon_atlas = icon_atlas if icon_atlas is not None else IconAtlas.open_default()
+        # Rendered wind barbs; wind comes in 10 degree / 1 knot steps, so few are distinct
+        self.barb_sprites = SpriteCache()
+
+        self.font18: 'ImageFont.FreeTypeFont' = None
+        self.font24: 'ImageFont.FreeTypeFont' = None
+        self.font35: 'ImageFont.FreeTypeFont' = None
+
+        self.frame_diff = FrameDiff(WIDTH, HEIGHT)
+        # Which init sequence the panel was last set up with: 'full' or 'partial'
+        self.epd_mode = None
 
-        self.font18: ImageFont = None
-        self.font24: ImageFont = None
-        self.font35: ImageFont = None
+        # Last frame shown on the panel, kept across restarts (hardware only)
+        self.frame_store = None
 
         if not dev_mode:
             self.epd = self.init_display()
+            self.frame_store = frame_store if frame_store is not None else FrameStore()
+            self.load_last_frame()
         
         self.image = self.init_image()
         self.draw = self.init_draw(self.image)
@@ -28,37 +126,108 @@ class DisplayManager:
 
     def init_display(self):
         from display.epd_interface import EPD
-        epd = EPD()
-        
-        logger.info("Init EPD display")
-        epd.init()
+        # The panel itself is initialized on the first refresh, so a run whose
+        # frame is already on the glass never touches it
+        return EPD(self.epd_backend, self.metrics)
+
+    def load_last_frame(self):
+        stored = self.frame_store.load()
+        if stored is not None:
+            frame, partial_count = stored
+            logger.info("Resuming from last frame in %s", self.frame_store.path)
+            self.frame_diff.seed(frame)
+            self.frame_diff.partial_count = partial_count
 
-        return epd
+    def shutdown(self):
+        """Put the panel into deep sleep if this manager has woken it"""
+        if not self.dev_mode and self.epd_mode is not None:
+            logger.info("Putting EPD display to sleep")
+            self.epd.sleep()
+            # Waking from deep sleep needs a full reset, i.e. a fresh init
+            self.epd_mode = None
 
     def init_image(self):
+        from PIL import Image
         return Image.new('1', (WIDTH, HEIGHT), 255)
     
-    def init_draw(self, image: Image):
+    def init_draw(self, image: 'Image.Image'):
+        from PIL import ImageDraw
         return ImageDraw.Draw(image)
 
     def load_fonts(self):
-        picdir = Path(__file__).resolve().parent / 'pic'
-        self.font24 = ImageFont.truetype(str(picdir / 'Font.ttc'), 24)
-        self.font18 = ImageFont.truetype(str(picdir / 'Font.ttc'), 18)
-        self.font35 = ImageFont.truetype(str(picdir / 'Font.ttc'), 35)
+        # Shared by every DisplayManager in the process; each size is loaded once
+        self.font24 = FONTS.get(24)
+        self.font18 = FONTS.get(18)
+        self.font35 = FONTS.get(35)
 
     def get_text_size(self, draw, text, font):
-        # Try the new method first (Pillow 8.0.0+)
-        if hasattr(draw, 'textbbox'):
-            bbox = draw.textbbox((0, 0), text, font=font)
-            return bbox[2] - bbox[0], bbox[3] - bbox[1]
-        # Fall back to the old method (Pillow < 10.0.0)
-        else:
-            return draw.textsize(text, font=font)
+        # Memoized per (font, text); matches draw.textbbox at the origin
+        return text_size(font, text)
+
+    def draw_text(self, xy, text, font, fill=None):
+        """self.draw.text, composed from cached glyph bitmaps where possible"""
+        GLYPHS.text(self.image, self.draw, xy, text, font, fill)
 
 
     def render_display(self):
-        self.draw.text((10, 10), f"KORH", font=self.font35, fill=0)
+        """
+        Returns:
+            True if the panel was refreshed (and post_refresh_delay slept)
+        """
+        refreshed = False
+        with self.metrics.span('render_display'):
+            self.draw_frame()
+
+            if not self.dev_mode:
+                # Packed into a pooled buffer; frame_diff and frame_store copy what they keep
+                frame = self.epd.getbuffer_into(self.image, self.epd.pool.frame(self.epd.plane_size))
+                plan = self.present_frame(frame)
+                refreshed = bool(plan.full or plan.windows)
+            else: self.save_display_preview(self.preview_path)
+        self.metrics.flush()
+
+        if refreshed:
+            time.sleep(self.post_refresh_delay)
+        return refreshed
+
+    @timed('present_frame')
+    def present_frame(self, buffer):
+        """
+        Bring the panel up to date with a packed frame, using windowed partial
+        refreshes when only small areas changed.
+
+        Returns:
+            The RefreshPlan that was carried out
+        """
+        plan = self.frame_diff.plan(buffer)
+        # Switching modes re-sends the controller setup only; the backend's
+        # module_init keeps an already open SPI device rather than reopening it
+        if plan.full:
+            if self.epd_mode != 'full':
+                logger.info("Init EPD display")
+                self.epd.init()
+                self.epd_mode = 'full'
+            self.epd.display(buffer)
+        elif plan.windows:
+            if self.epd_mode != 'partial':
+                self.epd.init_part()
+                self.epd_mode = 'partial'
+            for window in plan.windows:
+                logger.debug("Partial refresh of %s", window)
+                self.epd.display_Partial(self.frame_diff.crop(buffer, window), *window)
+        else:
+            logger.info("Frame unchanged, skipping refresh")
+            return plan
+        self.frame_diff.commit(buffer, plan)
+        if self.frame_store is not None:
+            self.frame_store.save(buffer, self.frame_diff.partial_count)
+        return plan
+
+    @timed('draw_frame')
+    def draw_frame(self):
+        """Draw the full layout onto a blank frame in self.image"""
+        self.draw.rectangle((0, 0, WIDTH, HEIGHT), fill=255)
+        self.draw_text((10, 10), f"KORH", font=self.font35, fill=0)
         self.draw_right_aligned_text("39m ago", 10, 10, self.font18)
 
         self.draw_current_icon()
@@ -72,74 +241,31 @@ class DisplayManager:
         # self.draw_wind_barb(350, 330, 65, 180, scale=2)
         # self.draw_wind_barb(500, 400, 45, 200, scale=2)
 
-
-        if not self.dev_mode:
-            self.epd.display(self.epd.getbuffer(self.image))
-            time.sleep(20)
-        else: self.save_display_preview('weather_preview.png')
-
     def draw_right_aligned_text(self, text, y, margin, font, fill=0):
         """Draw text right-aligned with a consistent margin"""
         text_width, text_height = self.get_text_size(self.draw, text, font=font)
         x = self.image.width - text_width - margin
         # Draw the text
-        self.draw.text((x, y), text, font=font, fill=fill)
+        self.draw_text((x, y), text, font=font, fill=fill)
         return y + text_height
 
-    def save_display_preview(self, filename=None, scale=2):
+    @timed('save_display_preview')
+    def save_display_preview(self, filename=None, scale=2, compress_level=PREVIEW_COMPRESS_LEVEL):
         """
-        Save a preview of the e-ink display content to a file and optionally open it.
-        
-        Args:
-            image: PIL Image object containing the display content
-            filename: Path where to save the preview (default: creates a timestamped file)
-            preview: If True, tries to open the image in the default viewer
-            scale: Scale factor to make the preview larger and more visible (default: 2)
-        
+        Save a preview of the e-ink display content to a file; see save_preview.
+
         Returns:
             Path to the saved preview file
         """
-        import os
-        import datetime
-        from PIL import Image, ImageOps
-        
-        if filename is None:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"eink_preview_{timestamp}.png"
-        
-        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
-        
-        # Create a copy of the image to avoid modifying the original
-        preview_image = self.image.copy()
-        
-        # Convert to RGB to better simulate e-ink appearance
-        if preview_image.mode == '1':
-            # For 1-bit images, convert to RGB with proper black and white
-            preview_image = preview_image.convert('RGB')
-            
-            # Optional: Add slight gray tinting to simulate e-ink appearance
-            pixels = preview_image.load()
-            width, height = preview_image.size
-            for x in range(width):
-                for y in range(height):
-                    r, g, b = pixels[x, y]
-                    if r > 200 and g > 200 and b > 200:  # If it's close to white
-                        pixels[x, y] = (245, 245, 240)  # Slight off-white for e-ink simulation
-        
-        # Scale up for better visibility
-        if scale != 1:
-            width, height = preview_image.size
-            preview_image = preview_image.resize((width * scale, height * scale), Image.LANCZOS)
-        
-        preview_image.save(filename)
-        print(f"Preview saved to: {filename}")
-        
-        return filename
+        return save_preview(self.image, filename, scale, compress_level)
     
     def draw_current_icon(self):
-        picdir = Path(__file__).resolve().parent / 'pic' / 'wi-cloud.bmp'
-        self.scale_and_display_bmp(picdir, position=(0, 50))
-        self.draw.text((10, 120), 'Cloudy', font=self.font24)
+        if self.icon_atlas is not None and ('wi-cloud', 83) in self.icon_atlas:
+            self.icon_atlas.paste(self.image, 'wi-cloud', 83, position=(0, 50))
+        else:
+            picdir = Path(__file__).resolve().parent / 'pic' / 'wi-cloud.bmp'
+            self.scale_and_display_bmp(picdir, position=(0, 50))
+        self.draw_text((10, 120), 'Cloudy', font=self.font24)
 
         return
     
@@ -158,32 +284,8 @@ class DisplayManager:
         Returns:
             The PIL Image with the icon added
         """
-        # Check if the file exists
-        if not os.path.exists(bmp_path):
-            raise FileNotFoundError(f"BMP file not found: {bmp_path}")
-        
-        # Open the BMP file
-        original_image = Image.open(bmp_path)
-        
-        # Calculate the new dimensions
-        width, height = original_image.size
-        new_width = int(width * scale_factor)
-        new_height = int(height * scale_factor)
-        
-        # Scale the image using high-quality resampling
-        if scale_factor != 1.0:
-            scaled_image = original_image.resize((new_width, new_height), Image.LANCZOS)
-        else:
-            scaled_image = original_image
-        
-        # Convert to 1-bit mode for e-ink display if needed
-        if scaled_image.mode != '1':
-            scaled_image = scaled_image.convert('1')
-        
-        # Invert if requested
-        if inverted:
-            scaled_image = ImageChops.invert(scaled_image)
-        
+        scaled_image = self.icon_cache.get(bmp_path, scale_factor, inverted)
+
         # Paste the scaled icon at the specified position
         self.image.paste(scaled_image, position)
 
@@ -205,13 +307,24 @@ class DisplayManager:
                         Positive = counterclockwise from staff (left side)
                         Negative = clockwise from staff (right side)
         """
+        key = (center_x, center_y, wind_speed, wind_direction, scale, line_width, barb_angle)
+        sprite = self.barb_sprites.get(
+            key, self.image.size,
+            lambda draw: self._render_wind_barb(draw, *key))
+        if sprite is not None:
+            mask, position = sprite
+            self.image.paste(color, position, mask)
+
+    def _render_wind_barb(self, draw, center_x, center_y, wind_speed, wind_direction, scale,
+                          line_width, barb_angle, color=255):
+        """Draw a wind barb with `draw`; see draw_wind_barb"""
         
         # Handle calm wind (< 3 knots)
         if wind_speed < 3:
             # Draw a circle for calm wind
             radius = int(6 * scale)
             bbox = [center_x - radius, center_y - radius, center_x + radius, center_y + radius]
-            self.draw.ellipse(bbox, outline=color, width=line_width)
+            draw.ellipse(bbox, outline=color, width=line_width)
             return
         
         # Base dimensions scaled
@@ -232,7 +345,7 @@ class DisplayManager:
         end_y = center_y - (staff_length / 2) * math.sin(staff_angle_rad)
         
         # Draw the staff (main line)
-        self.draw.line([(start_x, start_y), (end_x, end_y)], fill=color, width=line_width)
+        draw.line([(start_x, start_y), (end_x, end_y)], fill=color, width=line_width)
         
         # Calculate the unit vector along the staff (direction of wind)
         staff_unit_x = math.cos(staff_angle_rad)
@@ -273,7 +386,7 @@ class DisplayManager:
             base_y = current_y - (barb_spacing * 0.8) * staff_unit_y
             
             # Draw filled triangle for pennant
-            self.draw.polygon([(current_x, current_y), (tip_x, tip_y), (base_x, base_y)], fill=color)
+            draw.polygon([(current_x, current_y), (tip_x, tip_y), (base_x, base_y)], fill=color)
             
             # Move position back along staff for next barb
             current_x -= barb_spacing * staff_unit_x * 1.2
@@ -288,7 +401,7 @@ class DisplayManager:
             barb_end_y = current_y + barb_length * barb_unit_y
             
             # Draw the barb
-            self.draw.line([(current_x, current_y), (barb_end_x, barb_end_y)], fill=color, width=line_width)
+            draw.line([(current_x, current_y), (barb_end_x, barb_end_y)], fill=color, width=line_width)
             
             # Move position back along staff for next barb
             current_x -= barb_spacing * staff_unit_x
@@ -303,5 +416,5 @@ class DisplayManager:
             half_barb_end_y = current_y + (barb_length / 2) * barb_unit_y
             
             # Draw the half-barb
-            self.draw.line([(current_x, current_y), (half_barb_end_x, half_barb_end_y)], 
+            draw.line([(current_x, current_y), (half_barb_end_x, half_barb_end_y)], 
                         fill=color, width=line_width)
\ No newline at end of file
@@ -27,16 +27,167 @@
 # THE SOFTWARE.
 #
 
+import functools
+import json
 import os
 import logging
 import sys
 import time
-import subprocess
-
-from ctypes import *
+from collections import namedtuple
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# spidev splits writebytes2 transfers into ioctls of this many bytes
+SPIDEV_BUFSIZ_PATH = '/sys/module/spidev/parameters/bufsiz'
+SPIDEV_DEFAULT_BUFSIZ = 4096
+
+
+def spidev_bufsiz():
+    try:
+        with open(SPIDEV_BUFSIZ_PATH) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return SPIDEV_DEFAULT_BUFSIZ
+
+
+# SPI clock in Hz, SPI mode (0-3) and bytes per write ioctl (None: spidev's bufsiz)
+SpiSettings = namedtuple('SpiSettings', ['speed_hz', 'mode', 'chunk_size'])
+DEFAULT_SPI_SETTINGS = SpiSettings(speed_hz=4000000, mode=0b00, chunk_size=None)
+
+
+def default_spi_profile_path():
+    config_dir = os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config'
+    return Path(config_dir) / 'weather-epd' / 'spi_profile.json'
+
+
+def load_spi_profile(path=None):
+    """
+    Returns:
+        The SpiSettings saved by `python -m display.spi_calibrate`, or the
+        defaults if there is no usable profile
+    """
+    path = Path(path) if path is not None else default_spi_profile_path()
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+        settings = SpiSettings(int(profile['speed_hz']), int(profile['mode']), profile.get('chunk_size'))
+    except FileNotFoundError:
+        return DEFAULT_SPI_SETTINGS
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring unusable SPI profile %s: %s", path, e)
+        return DEFAULT_SPI_SETTINGS
+    logger.debug("SPI settings from %s: %s", path, settings)
+    return settings
+
+
+def save_spi_profile(settings, path=None, **details):
+    """Write `settings` (plus any calibration `details`) where load_spi_profile finds them"""
+    path = Path(path) if path is not None else default_spi_profile_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(settings._asdict(), **details), f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+# Where Waveshare's DEV_Config shared library (lgpio-based) is looked for
+DEV_CONFIG_DIRS = (
+    os.path.dirname(os.path.realpath(__file__)),
+    '/usr/local/lib',
+    '/usr/lib',
+)
+
+# DEV_Module_Init opens SPI 0.0 at this clock; the library has no way to change it
+DEV_CONFIG_SPI_HZ = 10000000
+
+
+@functools.lru_cache(maxsize=None)
+def load_dev_config():
+    """
+    Load DEV_Config_32.so or DEV_Config_64.so, matching this interpreter's
+    word size, with the argument types of the functions used declared.
+    The library is resolved once per process and shared.
+
+    Raises:
+        RuntimeError: if the library is in none of DEV_CONFIG_DIRS
+    """
+    import ctypes
+    import struct
+
+    bits = struct.calcsize('P') * 8
+    name = 'DEV_Config_64.so' if bits == 64 else 'DEV_Config_32.so'
+    for find_dir in DEV_CONFIG_DIRS:
+        so_filename = os.path.join(find_dir, name)
+        if os.path.exists(so_filename):
+            break
+    else:
+        raise RuntimeError(f"Cannot find {name} in {', '.join(DEV_CONFIG_DIRS)}")
+    logger.debug("Loading %s (%d bit)", so_filename, bits)
+
+    lib = ctypes.CDLL(so_filename)
+    lib.DEV_Module_Init.restype = ctypes.c_uint8
+    lib.DEV_Module_Init.argtypes = []
+    lib.DEV_Module_Exit.restype = None
+    lib.DEV_Module_Exit.argtypes = []
+    lib.DEV_Digital_Write.restype = None
+    lib.DEV_Digital_Write.argtypes = [ctypes.c_uint16, ctypes.c_uint8]
+    lib.DEV_Digital_Read.restype = ctypes.c_uint8
+    lib.DEV_Digital_Read.argtypes = [ctypes.c_uint16]
+    lib.DEV_SPI_WriteByte.restype = None
+    lib.DEV_SPI_WriteByte.argtypes = [ctypes.c_uint8]
+    lib.DEV_SPI_Write_nByte.restype = None
+    lib.DEV_SPI_Write_nByte.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+    return lib
+
+
+def buffer_address(data):
+    """
+    Address of `data`'s bytes for passing to C, without copying bytes,
+    bytearrays or writable memoryviews. Read-only views (slices of bytes)
+    are copied, as ctypes cannot point into them.
+
+    Returns:
+        (address, length, owner); `owner` must stay referenced while the
+        address is used
+    """
+    import ctypes
+
+    if isinstance(data, list):
+        data = bytes(data)
+    if isinstance(data, bytes):
+        owner = ctypes.c_char_p(data)
+        return ctypes.cast(owner, ctypes.c_void_p).value, len(data), owner
+    view = memoryview(data)
+    array_type = ctypes.c_ubyte * view.nbytes
+    owner = array_type.from_buffer_copy(view) if view.readonly else array_type.from_buffer(view)
+    return ctypes.addressof(owner), view.nbytes, owner
+
+
+def _ignore_write(value):
+    pass
+
+
+class TransferStats:
+    """Running totals of the GPIO writes and SPI transfers issued by a config."""
+
+    def __init__(self):
+        self.gpio_writes = 0
+        self.spi_calls = 0
+        self.spi_bytes = 0
+
+    def snapshot(self):
+        return {
+            'gpio_writes': self.gpio_writes,
+            'spi_calls': self.spi_calls,
+            'spi_bytes': self.spi_bytes,
+        }
+
+    def since(self, snapshot):
+        """Counts accumulated since an earlier snapshot()."""
+        return {key: value - snapshot[key] for key, value in self.snapshot().items()}
+
 
 class RaspberryPi:
     # Pin definition
@@ -48,61 +199,93 @@ class RaspberryPi:
     MOSI_PIN = 10
     SCLK_PIN = 11
 
-    def __init__(self):
+    def __init__(self, spi_settings=None, gpio=None):
+        """
+        Args:
+            spi_settings: SpiSettings to use; by default the calibrated profile
+                          if there is one, else DEFAULT_SPI_SETTINGS
+            gpio: GPIO backend from display.gpio_backends, or its name; by
+                  default $WEATHER_EPD_GPIO, else gpiozero
+        """
         import spidev
-        import gpiozero
-        
+        from display.gpio_backends import DEFAULT_GPIO_BACKEND, create_gpio
+
+        if gpio is None:
+            gpio = os.environ.get('WEATHER_EPD_GPIO', DEFAULT_GPIO_BACKEND)
+        self.gpio = create_gpio(gpio) if isinstance(gpio, str) else gpio
+
         self.SPI = spidev.SpiDev()
-        self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
-        self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
-        # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
-        self.GPIO_PWR_PIN    = gpiozero.LED(self.PWR_PIN)
-        self.GPIO_BUSY_PIN   = gpiozero.Button(self.BUSY_PIN, pull_up = False)
+        self.stats = TransferStats()
+        # Each pin is claimed once and driven through a callable bound to it.
+        # CS is driven by the SPI controller, so writes to it are dropped and
+        # not counted.
+        self._outputs = {pin: self.gpio.output(pin) for pin in (self.RST_PIN, self.DC_PIN, self.PWR_PIN)}
+        self.gpio.input(self.BUSY_PIN, pull_up=False)
+        self._writers = {pin: self._counted(write) for pin, write in self._outputs.items()}
+        self._writers[self.CS_PIN] = _ignore_write
+        self._readers = {pin: self.gpio.reader(pin) for pin in (self.RST_PIN, self.DC_PIN, self.PWR_PIN,
+                                                                self.BUSY_PIN)}
+
+        self.kernel_bufsiz = spidev_bufsiz()
+        self.configure_spi(spi_settings if spi_settings is not None else load_spi_profile())
+
+    def configure_spi(self, settings):
+        """Apply SpiSettings; takes effect immediately if the SPI device is open"""
+        self.spi_settings = settings
+        # Bytes per write ioctl; spidev cannot go above its module bufsiz
+        self.spi_bufsiz = min(settings.chunk_size or self.kernel_bufsiz, self.kernel_bufsiz)
+        if self.SPI.fileno() != -1:
+            self.SPI.max_speed_hz = settings.speed_hz
+            self.SPI.mode = settings.mode
 
-        
+    def _counted(self, write):
+        stats = self.stats
+
+        def counted_write(value):
+            stats.gpio_writes += 1
+            write(value)
+        return counted_write
+
+    def pin_writer(self, pin):
+        """A callable that sets `pin`, equivalent to partial(digital_write, pin)"""
+        return self._writers.get(pin, _ignore_write)
 
     def digital_write(self, pin, value):
-        if pin == self.RST_PIN:
-            if value:
-                self.GPIO_RST_PIN.on()
-            else:
-                self.GPIO_RST_PIN.off()
-        elif pin == self.DC_PIN:
-            if value:
-                self.GPIO_DC_PIN.on()
-            else:
-                self.GPIO_DC_PIN.off()
-        # elif pin == self.CS_PIN:
-        #     if value:
-        #         self.GPIO_CS_PIN.on()
-        #     else:
-        #         self.GPIO_CS_PIN.off()
-        elif pin == self.PWR_PIN:
-            if value:
-                self.GPIO_PWR_PIN.on()
-            else:
-                self.GPIO_PWR_PIN.off()
+        self._writers.get(pin, _ignore_write)(value)
 
     def digital_read(self, pin):
+        read = self._readers.get(pin)
+        return read() if read is not None else None
+
+    def digital_wait(self, pin, value, timeout):
+        """Block until `pin` reads `value` or `timeout` seconds pass. Returns True on a match."""
         if pin == self.BUSY_PIN:
-            return self.GPIO_BUSY_PIN.value
-        elif pin == self.RST_PIN:
-            return self.RST_PIN.value
-        elif pin == self.DC_PIN:
-            return self.DC_PIN.value
-        # elif pin == self.CS_PIN:
-        #     return self.CS_PIN.value
-        elif pin == self.PWR_PIN:
-            return self.PWR_PIN.value
+            return self.gpio.wait_for(pin, value, timeout)
+        deadline = time.monotonic() + timeout
+        while self.digital_read(pin) != value:
+            if time.monotonic() >= deadline:
+                return False
+            self.delay_ms(1)
+        return True
 
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
+        self.stats.spi_calls += 1
+        self.stats.spi_bytes += len(data)
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        self.stats.spi_calls += max(1, -(-len(data) // self.spi_bufsiz))
+        self.stats.spi_bytes += len(data)
+        if self.spi_bufsiz >= self.kernel_bufsiz or len(data) <= self.spi_bufsiz:
+            # writebytes2 already splits at the module bufsiz
+            self.SPI.writebytes2(data)
+        else:
+            view = memoryview(bytes(data) if isinstance(data, list) else data)
+            for start in range(0, len(view), self.spi_bufsiz):
+                self.SPI.writebytes2(view[start:start + self.spi_bufsiz])
 
     def DEV_SPI_write(self, data):
         self.DEV_SPI.DEV_SPI_SendData(data)
@@ -114,52 +297,149 @@ class RaspberryPi:
         return self.DEV_SPI.DEV_SPI_ReadData()
 
     def module_init(self, cleanup=False):
-        self.GPIO_PWR_PIN.on()
-        
-        if cleanup:
-            find_dirs = [
-                os.path.dirname(os.path.realpath(__file__)),
-                '/usr/local/lib',
-                '/usr/lib',
-            ]
-            self.DEV_SPI = None
-            for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
-                if val == 64:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
-                else:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_32.so')
-                if os.path.exists(so_filename):
-                    self.DEV_SPI = CDLL(so_filename)
-                    break
-            if self.DEV_SPI is None:
-                RuntimeError('Cannot find DEV_Config.so')
+        self._outputs[self.PWR_PIN](1)
 
+        if cleanup:
+            self.DEV_SPI = load_dev_config()
             self.DEV_SPI.DEV_Module_Init()
 
         else:
-            # SPI device, bus = 0, device = 0
-            self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
-            self.SPI.mode = 0b00
+            # init()/init_part() run this on every mode switch. spidev's open()
+            # replaces its fd without closing the old one, so the device is
+            # only opened when closed and otherwise just reconfigured.
+            if self.SPI.fileno() == -1:
+                # SPI device, bus = 0, device = 0
+                self.SPI.open(0, 0)
+            self.configure_spi(self.spi_settings)
         return 0
 
     def module_exit(self, cleanup=False):
         logger.debug("spi end")
         self.SPI.close()
 
-        self.GPIO_RST_PIN.off()
-        self.GPIO_DC_PIN.off()
-        self.GPIO_PWR_PIN.off()
+        self._outputs[self.RST_PIN](0)
+        self._outputs[self.DC_PIN](0)
+        self._outputs[self.PWR_PIN](0)
         logger.debug("close 5V, Module enters 0 power consumption ...")
-        
+
         if cleanup:
-            self.GPIO_RST_PIN.close()
-            self.GPIO_DC_PIN.close()
-            # self.GPIO_CS_PIN.close()
-            self.GPIO_PWR_PIN.close()
-            self.GPIO_BUSY_PIN.close()
+            self.gpio.close()
+
+
+class NativeRaspberryPi:
+    """
+    Backend on Waveshare's DEV_Config shared library (load_dev_config), which
+    drives the pins and SPI through lgpio from C. Frames are handed to
+    DEV_SPI_Write_nByte as pointers into the caller's buffer, so a full plane
+    goes out without the Python-side list/bytes copies spidev makes.
+
+    The library opens SPI at a fixed DEV_CONFIG_SPI_HZ; only the chunk size of
+    the SpiSettings applies. CS is a plain GPIO here, driven like the others
+    but, as with RaspberryPi, not counted in stats.gpio_writes.
+    """
+    RST_PIN  = RaspberryPi.RST_PIN
+    DC_PIN   = RaspberryPi.DC_PIN
+    CS_PIN   = RaspberryPi.CS_PIN
+    BUSY_PIN = RaspberryPi.BUSY_PIN
+    PWR_PIN  = RaspberryPi.PWR_PIN
+    MOSI_PIN = RaspberryPi.MOSI_PIN
+    SCLK_PIN = RaspberryPi.SCLK_PIN
+
+    def __init__(self, spi_settings=None):
+        self.lib = load_dev_config()
+        self.stats = TransferStats()
+        self.kernel_bufsiz = spidev_bufsiz()
+        # DEV_Module_Init claims the pins and opens SPI, and DEV_Module_Exit
+        # does not release them, so the library is only initialized once
+        self._opened = False
+        self.configure_spi(spi_settings if spi_settings is not None else load_spi_profile())
+
+    def configure_spi(self, settings):
+        if settings.speed_hz != DEV_CONFIG_SPI_HZ or settings.mode != 0:
+            logger.debug("DEV_Config runs SPI at %d Hz, mode 0; ignoring %s", DEV_CONFIG_SPI_HZ, settings)
+        self.spi_settings = SpiSettings(DEV_CONFIG_SPI_HZ, 0b00, settings.chunk_size)
+        # lgSpiWrite is one spidev ioctl, so it is bound by the module bufsiz too
+        self.spi_bufsiz = min(settings.chunk_size or self.kernel_bufsiz, self.kernel_bufsiz)
+
+    def pin_writer(self, pin):
+        """A callable that sets `pin`, equivalent to partial(digital_write, pin)"""
+        stats, write = self.stats, self.lib.DEV_Digital_Write
+
+        def counted_write(value):
+            stats.gpio_writes += 1
+            write(pin, 1 if value else 0)
+
+        def uncounted_write(value):
+            write(pin, 1 if value else 0)
+        return uncounted_write if pin == self.CS_PIN else counted_write
+
+    def digital_write(self, pin, value):
+        # CS writes are left out of the counts, as RaspberryPi leaves them to
+        # spidev, so gpio_writes compare between the backends
+        if pin != self.CS_PIN:
+            self.stats.gpio_writes += 1
+        self.lib.DEV_Digital_Write(pin, 1 if value else 0)
+
+    def digital_read(self, pin):
+        return self.lib.DEV_Digital_Read(pin)
+
+    def digital_wait(self, pin, value, timeout):
+        """Block until `pin` reads `value` or `timeout` seconds pass. Returns True on a match."""
+        deadline = time.monotonic() + timeout
+        while self.lib.DEV_Digital_Read(pin) != value:
+            if time.monotonic() >= deadline:
+                return False
+            self.delay_ms(1)
+        return True
+
+    def delay_ms(self, delaytime):
+        time.sleep(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self.stats.spi_calls += len(data)
+        self.stats.spi_bytes += len(data)
+        for byte in data:
+            self.lib.DEV_SPI_WriteByte(byte)
+
+    def spi_writebyte2(self, data):
+        # `owner` keeps the buffer pinned until the last chunk is written
+        address, length, owner = buffer_address(data)
+        self.stats.spi_calls += max(1, -(-length // self.spi_bufsiz))
+        self.stats.spi_bytes += length
+        write = self.lib.DEV_SPI_Write_nByte
+        for start in range(0, length, self.spi_bufsiz):
+            write(address + start, min(self.spi_bufsiz, length - start))
+
+    def module_init(self, cleanup=False):
+        if not self._opened:
+            if self.lib.DEV_Module_Init() != 0:
+                logger.error("DEV_Module_Init failed")
+                return -1
+            self._opened = True
+        self.lib.DEV_Digital_Write(self.PWR_PIN, 1)
+        return 0
+
+    def module_exit(self, cleanup=False):
+        self.lib.DEV_Digital_Write(self.RST_PIN, 0)
+        self.lib.DEV_Digital_Write(self.DC_PIN, 0)
+        self.lib.DEV_Digital_Write(self.PWR_PIN, 0)
+        logger.debug("close 5V, Module enters 0 power consumption ...")
+        self.lib.DEV_Module_Exit()
+
+
+# SPI/GPIO implementations selectable by name (main.py --backend, WEATHER_EPD_BACKEND)
+BACKENDS = {
+    'spidev': RaspberryPi,
+    'native': NativeRaspberryPi,
+}
+
+
+def create_backend(name, spi_settings=None):
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown EPD backend {name!r}; choose from {', '.join(BACKENDS)}") from None
+    return backend(spi_settings)
 
 
 # implementation = RaspberryPi()
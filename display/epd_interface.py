@@ -28,8 +28,15 @@
 #
 
 
+import functools
 import logging
-from display.epd_config import RaspberryPi
+import os
+import queue
+import threading
+import time
+
+from display.epd_config import create_backend
+from display.metrics import METRICS, timed
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -40,203 +47,387 @@ GRAY2  = 0xC0
 GRAY3  = 0x80 #gray
 GRAY4  = 0x00 #Blackest
 
+def _gray_level(value):
+    # 2-bit level of an 'L' pixel: 0xC0 and 0x80 are shifted down one step,
+    # everything else keeps its top two bits.
+    if value == 0xC0:
+        value = 0x80
+    elif value == 0x80:
+        value = 0x40
+    return value >> 6
+
+def _gray_plane_nibble(packed, bits):
+    # Map the four 2-bit levels of a packed byte to four plane bits, MSB first.
+    nibble = 0
+    for shift in (6, 4, 2, 0):
+        nibble = (nibble << 1) | bits[(packed >> shift) & 0x03]
+    return nibble
+
+# 'L' value -> 2-bit level already shifted into pixel slot 0..3 of a packed byte
+GRAY_PACK_TABLES = tuple(bytes(_gray_level(v) << (6 - 2 * slot) for v in range(256)) for slot in range(4))
+# Packed 2-bpp byte -> plane nibble (high, low) for the 0x10 and 0x13 RAM planes.
+# Level 0 (black) sets both planes, level 2 only the old plane, level 1 only the new one.
+GRAY_OLD_TABLES = tuple(bytes(_gray_plane_nibble(b, (1, 0, 1, 0)) << shift for b in range(256)) for shift in (4, 0))
+GRAY_NEW_TABLES = tuple(bytes(_gray_plane_nibble(b, (1, 1, 0, 0)) << shift for b in range(256)) for shift in (4, 0))
+
+# Marks the point in an init sequence where the panel has been powered on (0x04)
+# and the driver must wait for it to settle before continuing.
+POWER_ON_WAIT = object()
+
+def _compile_sequence(steps):
+    # Turn (command, data) pairs into ready-to-send byte runs
+    return tuple(step if step[0] is POWER_ON_WAIT else (bytes([step[0]]), bytes(step[1]))
+                 for step in steps)
+
+INIT_SEQUENCE = _compile_sequence((
+    (0x06, (0x17, 0x17, 0x28, 0x17)),   # btst. If an exception is displayed, try 0x38 for the third byte
+    (0x01, (0x07, 0x07, 0x28, 0x17)),   # POWER SETTING: VGH=20V,VGL=-20V, VDH=15V, VDL=-15V
+    (0x04, ()),                         # POWER ON
+    (POWER_ON_WAIT, ()),
+    (0x00, (0x1F,)),                    # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    (0x61, (0x03, 0x20, 0x01, 0xE0)),   # tres: source 800, gate 480
+    (0x15, (0x00,)),
+    # If the screen appears gray, use 0x50 (0x10, 0x17) followed by 0x52 (0x03)
+    (0x50, (0x10, 0x07)),
+    (0x60, (0x22,)),                    # TCON SETTING
+))
+
+INIT_FAST_SEQUENCE = _compile_sequence((
+    (0x00, (0x1F,)),                    # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    # If the screen appears gray, use 0x50 (0x10, 0x17) followed by 0x52 (0x03)
+    (0x50, (0x10, 0x07)),
+    (0x04, ()),                         # POWER ON
+    (POWER_ON_WAIT, ()),
+    (0x06, (0x27, 0x27, 0x18, 0x17)),   # Booster Soft Start (enhanced display drive)
+    (0xE0, (0x02,)),
+    (0xE5, (0x5A,)),
+))
+
+INIT_PART_SEQUENCE = _compile_sequence((
+    (0x00, (0x1F,)),                    # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    (0x04, ()),                         # POWER ON
+    (POWER_ON_WAIT, ()),
+    (0xE0, (0x02,)),
+    (0xE5, (0x6E,)),
+))
+
+INIT_4GRAY_SEQUENCE = _compile_sequence((
+    (0x00, (0x1F,)),                    # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    (0x50, (0x10, 0x07)),
+    (0x04, ()),                         # POWER ON
+    (POWER_ON_WAIT, ()),
+    (0x06, (0x27, 0x27, 0x18, 0x17)),   # Booster Soft Start (enhanced display drive)
+    (0xE0, (0x02,)),
+    (0xE5, (0x5F,)),
+))
+
+# Byte-wise NOT (0x00 <-> 0xFF), used with bytes.translate to flip a packed plane in bulk
+INVERT_TABLE = bytes(range(0xFF, -1, -1))
+
 logger = logging.getLogger(__name__)
 
-epd_config = RaspberryPi()
+_default_config = None
+
+def default_config():
+    # The Raspberry Pi backend claims GPIO pins, so it is only created when an
+    # EPD is built without an explicit backend, and then shared.
+    # WEATHER_EPD_BACKEND picks the implementation: spidev (default) or native
+    global _default_config
+    if _default_config is None:
+        _default_config = create_backend(os.environ.get('WEATHER_EPD_BACKEND', 'spidev'))
+    return _default_config
+
+def bind_pin(config, pin):
+    # A callable setting `pin`: the backend's own bound writer if it has one,
+    # else a partial over digital_write
+    pin_writer = getattr(config, 'pin_writer', None)
+    if pin_writer is not None:
+        return pin_writer(pin)
+    return functools.partial(config.digital_write, pin)
+
+class FramePool:
+    """
+    Packed frame buffers owned by one EPD and reused across refreshes, so a
+    refresh does not allocate (and leave for the allocator to hand back)
+    full-frame buffers on a memory-starved Pi Zero.
+
+    Frames come from a small ring per buffer size; the buffer returned by
+    frame() is handed out again `depth` calls later, which leaves one frame
+    being drawn while the previous one is still on its way to the panel.
+    Only callers that opt in (getbuffer_into) use them; getbuffer still
+    returns a buffer the caller owns.
+    """
+
+    def __init__(self, plane_size, depth=2):
+        self.depth = depth
+        self._rings = {}
+        self._constants = {}
+        # The 1-bpp ring is the one every refresh uses; others are allocated
+        # on first use
+        self._ring(plane_size)
+
+    def _ring(self, size):
+        ring = self._rings.get(size)
+        if ring is None:
+            ring = self._rings[size] = [[bytearray(size) for _ in range(self.depth)], 0]
+        return ring
+
+    def frame(self, size):
+        """The next reusable bytearray of `size` bytes; its contents are stale"""
+        ring = self._ring(size)
+        buffers, index = ring
+        ring[1] = (index + 1) % len(buffers)
+        return buffers[index]
+
+    def constant(self, size, value):
+        """A read-only plane of `size` bytes all set to `value`, built once"""
+        key = (size, value)
+        plane = self._constants.get(key)
+        if plane is None:
+            plane = self._constants[key] = bytes([value]) * size
+        return plane
+
 
 class EPD:
-    def __init__(self):
-        self.reset_pin = epd_config.RST_PIN
-        self.dc_pin = epd_config.DC_PIN
-        self.busy_pin = epd_config.BUSY_PIN
-        self.cs_pin = epd_config.CS_PIN
+    def __init__(self, config=None, metrics=None):
+        # Hardware backend: the shared default_config() when None (RaspberryPi or
+        # NativeRaspberryPi), or anything with the same pin constants and
+        # digital_write/digital_read/digital_wait/spi_writebyte/
+        # spi_writebyte2/delay_ms/module_init/module_exit methods, a TransferStats
+        # `stats` attribute and the spidev `spi_bufsiz`, such as
+        # epd_simulator.SimulatedPanel. An optional pin_writer(pin) hands out
+        # a callable bound to one pin.
+        if config is None:
+            config = default_config()
+        self.config = config
+        # Per-phase timings (display.metrics); the shared instance is a no-op
+        # unless enabled
+        self.metrics = metrics if metrics is not None else METRICS
+        self.reset_pin = config.RST_PIN
+        self.dc_pin = config.DC_PIN
+        self.busy_pin = config.BUSY_PIN
+        self.cs_pin = config.CS_PIN
+        # DC and CS toggle around every SPI write, so they are resolved once
+        self.set_dc = bind_pin(config, self.dc_pin)
+        self.set_cs = bind_pin(config, self.cs_pin)
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
         self.GRAY1  = GRAY1 #white
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
+        # Bytes in one packed 1-bpp RAM plane
+        self.plane_size = self.width // 8 * self.height
+        self.pool = FramePool(self.plane_size)
+        # Send each init command with its data in one SPI write; set to False to
+        # fall back to one transaction per byte (e.g. to compare init_stats)
+        self.batch_commands = True
+        self.init_stats = None
+        # Upper bound for a single busy wait, and how often to re-poll the
+        # controller while waiting for the BUSY edge
+        self.busy_timeout = 60.0
+        self.busy_poll_ms = 100
+        self.last_busy_time = None
+        # Send display()'s planes in spidev-bufsiz chunks from a writer thread,
+        # preparing each chunk while the previous one is on the wire
+        self.stream_transfers = False
+        # Chunks queued ahead of the writer thread while streaming
+        self.stream_depth = 2
     
     # Hardware reset
     def reset(self):
-        epd_config.digital_write(self.reset_pin, 1)
-        epd_config.delay_ms(20) 
-        epd_config.digital_write(self.reset_pin, 0)
-        epd_config.delay_ms(2)
-        epd_config.digital_write(self.reset_pin, 1)
-        epd_config.delay_ms(20)   
+        self.config.digital_write(self.reset_pin, 1)
+        self.config.delay_ms(20) 
+        self.config.digital_write(self.reset_pin, 0)
+        self.config.delay_ms(2)
+        self.config.digital_write(self.reset_pin, 1)
+        self.config.delay_ms(20)   
 
     def send_command(self, command):
-        epd_config.digital_write(self.dc_pin, 0)
-        epd_config.digital_write(self.cs_pin, 0)
-        epd_config.spi_writebyte([command])
-        epd_config.digital_write(self.cs_pin, 1)
+        self.set_dc(0)
+        self.set_cs(0)
+        self.config.spi_writebyte([command])
+        self.set_cs(1)
 
     def send_data(self, data):
-        epd_config.digital_write(self.dc_pin, 1)
-        epd_config.digital_write(self.cs_pin, 0)
-        epd_config.spi_writebyte([data])
-        epd_config.digital_write(self.cs_pin, 1)
+        self.set_dc(1)
+        self.set_cs(0)
+        self.config.spi_writebyte([data])
+        self.set_cs(1)
+
+    def send_command_data(self, command, data):
+        # One transaction per command: the command byte(s) with DC low, then all
+        # parameter bytes in a single write with DC high.
+        self.set_dc(0)
+        self.set_cs(0)
+        self.config.spi_writebyte2(command)
+        if data:
+            self.set_dc(1)
+            self.config.spi_writebyte2(data)
+        self.set_cs(1)
 
     def send_data2(self, data):
-        epd_config.digital_write(self.dc_pin, 1)
-        epd_config.digital_write(self.cs_pin, 0)
-        epd_config.SPI.writebytes2(data)
-        epd_config.digital_write(self.cs_pin, 1)
+        self.set_dc(1)
+        self.set_cs(0)
+        self.config.spi_writebyte2(data)
+        self.set_cs(1)
+
+    def write_plane(self, command, data):
+        # Send a RAM plane (0x10 old data, 0x13 new data) as one transfer
+        with self.metrics.span('transfer_0x%02X' % command, bytes=len(data)):
+            self.send_command(command)
+            self.send_data2(data)
+
+    def stream_plane(self, command, chunks):
+        # Send a RAM plane from an iterable of byte chunks, in one CS-low data
+        # phase exactly like write_plane. A worker thread writes each chunk to
+        # SPI while the iterable produces the next, so packing overlaps the
+        # transfer, and at most stream_depth chunks are held at a time.
+        pending = queue.Queue(maxsize=self.stream_depth)
+        errors = []
+
+        def writer():
+            while True:
+                chunk = pending.get()
+                if chunk is None:
+                    return
+                if not errors:
+                    try:
+                        self.config.spi_writebyte2(chunk)
+                    except BaseException as e:
+                        errors.append(e)
+
+        with self.metrics.span('transfer_0x%02X' % command) as span:
+            self.send_command(command)
+            self.set_dc(1)
+            self.set_cs(0)
+            worker = threading.Thread(target=writer, name='epd-spi', daemon=True)
+            worker.start()
+            sent = 0
+            try:
+                for chunk in chunks:
+                    if errors:
+                        break
+                    pending.put(chunk)
+                    sent += len(chunk)
+            finally:
+                pending.put(None)
+                worker.join()
+                self.set_cs(1)
+            span.add(bytes=sent)
+        if errors:
+            raise errors[0]
+
+    def plane_chunks(self, data, invert=False):
+        # Split a packed plane into spidev-bufsiz pieces, inverting each piece
+        # only when it is about to be queued
+        chunk_size = self.config.spi_bufsiz
+        view = memoryview(data)
+        for start in range(0, len(data), chunk_size):
+            chunk = view[start:start + chunk_size]
+            yield bytes(chunk).translate(INVERT_TABLE) if invert else chunk
+
+    def pack_bands(self, image, invert=False):
+        # Pack a 1-bit image of the panel's size in row bands of at most one
+        # spidev-bufsiz chunk, in getbuffer's byte layout. invert=True gives the
+        # "old data" plane: Pillow's own 1 = white packing is its complement.
+        rawmode = '1' if invert else '1;I'
+        row_bytes = (image.width + 7) // 8
+        rows = max(1, self.config.spi_bufsiz // row_bytes)
+        for top in range(0, image.height, rows):
+            yield image.crop((0, top, image.width, min(top + rows, image.height))).tobytes('raw', rawmode)
+
+    def _refresh(self):
+        with self.metrics.span('refresh'):
+            self.send_command(0x12)
+            self.config.delay_ms(100)
+        self.ReadBusy()
 
-    def ReadBusy(self):
+    def invert_plane(self, data, length):
+        # Flip the first `length` bytes of a packed plane. bytes/bytearray are
+        # translated directly; other buffers (memoryview, lists) are copied once.
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data[:length])
+        elif len(data) != length:
+            data = data[:length]
+        return data.translate(INVERT_TABLE)
+
+    def ReadBusy(self, timeout=None):
+        # BUSY_PIN is low while the controller is working. Rather than spinning on
+        # Get Status (0x71), block on the pin's rising edge in busy_poll_ms slices and
+        # only re-issue 0x71 between slices, so the CPU idles during a refresh.
+        if timeout is None:
+            timeout = self.busy_timeout
         logger.debug("e-Paper busy")
-        self.send_command(0x71)
-        busy = epd_config.digital_read(self.busy_pin)
-        while(busy == 0):
+        with self.metrics.span('busy_wait'):
+            start = time.monotonic()
+            deadline = start + timeout
             self.send_command(0x71)
-            busy = epd_config.digital_read(self.busy_pin)
-        epd_config.delay_ms(20)
-        logger.debug("e-Paper busy release")
+            while not self.config.digital_wait(self.busy_pin, 1, self.busy_poll_ms / 1000.0):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("e-Paper still busy after %.1fs" % timeout)
+                self.send_command(0x71)
+            self.last_busy_time = time.monotonic() - start
+            self.config.delay_ms(20)
+        logger.debug("e-Paper busy release after %.3fs", self.last_busy_time)
+        return self.last_busy_time
         
     def init(self):
-        if (epd_config.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
-        
-        self.send_command(0x06)     # btst
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x28)        # If an exception is displayed, try using 0x38
-        self.send_data(0x17)
-        
-        self.send_command(0x01)			#POWER SETTING
-        self.send_data(0x07)
-        self.send_data(0x07)    #VGH=20V,VGL=-20V
-        self.send_data(0x28)		#VDH=15V
-        self.send_data(0x17)		#VDL=-15V
-
-        self.send_command(0x04) #POWER ON
-        epd_config.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61)        	#tres
-        self.send_data(0x03)		#source 800
-        self.send_data(0x20)
-        self.send_data(0x01)		#gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        # If the screen appears gray, use the annotated initialization command
-        self.send_command(0X50)
-        self.send_data(0x10)
-        self.send_data(0x07)
-        # self.send_command(0X50)
-        # self.send_data(0x10)
-        # self.send_data(0x17)
-        # self.send_command(0X52)		
-        # self.send_data(0x03)
-
-        self.send_command(0X60)			#TCON SETTING
-        self.send_data(0x22)
-
-        # EPD hardware init end
-        return 0
+        return self._run_init('init', INIT_SEQUENCE)
     
     def init_fast(self):
-        if (epd_config.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
-        
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        # If the screen appears gray, use the annotated initialization command
-        self.send_command(0X50)
-        self.send_data(0x10)
-        self.send_data(0x07)
-        # self.send_command(0X50)
-        # self.send_data(0x10)
-        # self.send_data(0x17)
-        # self.send_command(0X52)		
-        # self.send_data(0x03)
-
-        self.send_command(0x04) #POWER ON
-        epd_config.delay_ms(100) 
-        self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
-
-        #Enhanced display drive(Add 0x06 command)
-        self.send_command(0x06)			#Booster Soft Start 
-        self.send_data (0x27)
-        self.send_data (0x27)   
-        self.send_data (0x18)		
-        self.send_data (0x17)		
-
-        self.send_command(0xE0)
-        self.send_data(0x02)
-        self.send_command(0xE5)
-        self.send_data(0x5A)
-
-        # EPD hardware init end
-        return 0
+        return self._run_init('init_fast', INIT_FAST_SEQUENCE)
     
     def init_part(self):
-        if (epd_config.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x04) #POWER ON
-        epd_config.delay_ms(100) 
-        self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0xE0)
-        self.send_data(0x02)
-        self.send_command(0xE5)
-        self.send_data(0x6E)
-
-        # EPD hardware init end
-        return 0
+        return self._run_init('init_part', INIT_PART_SEQUENCE)
     
     # The feature will only be available on screens sold after 24/10/23
     def init_4Gray(self):
-        if (epd_config.module_init() != 0):
-            return -1
-        # EPD hardware init start
-        self.reset()
+        return self._run_init('init_4Gray', INIT_4GRAY_SEQUENCE)
 
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-        
-        self.send_command(0X50)
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0x04) #POWER ON
-        epd_config.delay_ms(100) 
-        self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
-
-        #Enhanced display drive(Add 0x06 command)
-        self.send_command(0x06)			#Booster Soft Start 
-        self.send_data (0x27)
-        self.send_data (0x27)   
-        self.send_data (0x18)		
-        self.send_data (0x17)	
-
-        self.send_command(0xE0)
-        self.send_data(0x02)
-        self.send_command(0xE5)
-        self.send_data(0x5F)
-
-        # EPD hardware init end
+    def _run_init(self, name, sequence):
+        with self.metrics.span('module_init'):
+            if (self.config.module_init() != 0):
+                return -1
+        start = self.config.stats.snapshot()
+        # EPD hardware init start
+        with self.metrics.span('reset'):
+            self.reset()
+        with self.metrics.span(name) as span:
+            for command, data in sequence:
+                if command is POWER_ON_WAIT:
+                    self.config.delay_ms(100)
+                    self.ReadBusy()        #waiting for the electronic paper IC to release the idle signal
+                elif self.batch_commands:
+                    self.send_command_data(command, data)
+                else:
+                    self.send_command(command[0])
+                    for byte in data:
+                        self.send_data(byte)
+            # EPD hardware init end
+            self.init_stats = self.config.stats.since(start)
+            span.add(bytes=self.init_stats['spi_bytes'])
+        logger.debug("%s: %d GPIO writes, %d SPI transfers, %d bytes", name,
+                     self.init_stats['gpio_writes'], self.init_stats['spi_calls'], self.init_stats['spi_bytes'])
         return 0
 
     def getbuffer(self, image):
+        """
+        Returns:
+            `image` packed for the panel, in a new bytearray
+        """
+        return self.getbuffer_into(image, bytearray(self.plane_size))
+
+    @timed('getbuffer')
+    def getbuffer_into(self, image, out):
+        """
+        Pack `image` for the panel into the existing bytearray `out` of
+        plane_size bytes, so the refresh path can reuse a buffer from
+        self.pool instead of allocating a frame per refresh.
+
+        Returns:
+            `out`
+        """
         img = image
         imwidth, imheight = img.size
         if(imwidth == self.width and imheight == self.height):
@@ -247,50 +438,36 @@ class EPD:
         else:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
+            out[:] = self.pool.constant(self.plane_size, 0x00)
+            return out
 
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
-        # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+        # in the e-paper world 0=white and 1=black. Pillow's '1;I' raw packer emits the
+        # inverted 1-bpp rows directly, so no per-byte pass is needed.
+        out[:] = img.tobytes('raw', '1;I')
+        return out
     
+    @timed('getbuffer_4Gray')
     def getbuffer_4Gray(self, image):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
         image_monocolor = image.convert('L')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
         # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+            image_monocolor = image_monocolor.rotate(90, expand=True)
+        else:
+            return bytearray(self.pool.constant(self.plane_size * 2, 0xFF))
+
+        # Quantize every pixel to its 2-bit level and pack four pixels per byte,
+        # leftmost pixel in the top bits: one translate per pixel slot, then OR.
+        raw = image_monocolor.tobytes()
+        packed = 0
+        for slot, table in enumerate(GRAY_PACK_TABLES):
+            packed |= int.from_bytes(raw[slot::4].translate(table), 'big')
+        return bytearray(packed.to_bytes(len(raw) // 4, 'big'))
 
     def display(self, image):
         if(self.width % 8 == 0):
@@ -298,29 +475,46 @@ class EPD:
         else:
             Width = self.width // 8 +1
         Height = self.height
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~image[i + j * Width]
-        self.send_command(0x10)
-        self.send_data2(image1)
-
-        self.send_command(0x13)
-        self.send_data2(image)
-
-        self.send_command(0x12)
-        epd_config.delay_ms(100)
-        self.ReadBusy()
+        if self.stream_transfers:
+            # Streamed as memoryview slices, which lists and other sequences lack
+            if not isinstance(image, (bytes, bytearray, memoryview)):
+                image = bytes(image)
+            self.stream_plane(0x10, self.plane_chunks(memoryview(image)[:Width * Height], invert=True))
+            self.stream_plane(0x13, self.plane_chunks(image))
+        else:
+            # "Old data" plane: the bitwise complement of the new frame
+            image1 = self.invert_plane(image, Width * Height)
+            self.write_plane(0x10, image1)
+            self.write_plane(0x13, image)
+
+        self._refresh()
+
+    def display_image(self, image):
+        """
+        Full refresh straight from a PIL image, without building the packed
+        frame or its inverted copy: both planes are packed in row bands that
+        are written to SPI while the next band is being packed.
+
+        Sends the same bytes as display(getbuffer(image)).
+        """
+        imwidth, imheight = image.size
+        if imwidth == self.width and imheight == self.height:
+            image = image.convert('1')
+        elif imwidth == self.height and imheight == self.width:
+            image = image.rotate(90, expand=True).convert('1')
+        else:
+            return self.display(self.getbuffer(image))
+
+        self.stream_plane(0x10, self.pack_bands(image, invert=True))
+        self.stream_plane(0x13, self.pack_bands(image))
+
+        self._refresh()
 
     def Clear(self):
-        self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
-        self.send_command(0x13)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.write_plane(0x10, self.pool.constant(self.plane_size, 0xFF))
+        self.write_plane(0x13, self.pool.constant(self.plane_size, 0x00))
 
-        self.send_command(0x12)
-        epd_config.delay_ms(100)
-        self.ReadBusy()
+        self._refresh()
 
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
         if((Xstart % 8 + Xend % 8 == 8 & Xstart % 8 > Xend % 8) | Xstart % 8 + Xend % 8 == 0 | (Xend - Xstart)%8 == 0):
@@ -336,105 +530,41 @@ class EPD:
         Width = (Xend - Xstart) // 8
         Height = Yend - Ystart
 	
-        self.send_command(0x50)
-        self.send_data(0xA9)
-        self.send_data(0x07)
+        self.send_command_data(b'\x50', b'\xA9\x07')
 
         self.send_command(0x91)		#This command makes the display enter partial mode
-        self.send_command(0x90)		#resolution setting
-        self.send_data (Xstart//256)
-        self.send_data (Xstart%256)   #x-start    
+        self.send_command_data(b'\x90', bytes((		#resolution setting
+            Xstart//256, Xstart%256,            #x-start
+            (Xend-1)//256, (Xend-1)%256,        #x-end
+            Ystart//256, Ystart%256,            #y-start
+            (Yend-1)//256, (Yend-1)%256,        #y-end
+            0x01,
+        )))
 
-        self.send_data ((Xend-1)//256)		
-        self.send_data ((Xend-1)%256)  #x-end	
+        # Only the window's bytes are sent; the controller ignores anything past
+        # the window, so padding to a full frame would just cost transfer time.
+        image1 = self.invert_plane(Image, Width * Height)
 
-        self.send_data (Ystart//256)  #
-        self.send_data (Ystart%256)   #y-start    
+        self.write_plane(0x13, image1)   #Write Black and White image to RAM
 
-        self.send_data ((Yend-1)//256)		
-        self.send_data ((Yend-1)%256)  #y-end
-        self.send_data (0x01)
+        self._refresh()
 
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~Image[i + j * Width]
+    def display_4Gray(self, image):
+        if not isinstance(image, (bytes, bytearray)):
+            image = bytes(image)
+        size = int(self.width * self.height / 8)
+        # Each plane byte covers eight pixels: the high nibble comes from the even
+        # 2-bpp byte and the low nibble from the odd one.
+        high, low = image[0:size * 2:2], image[1:size * 2:2]
 
-        self.send_command(0x13)   #Write Black and White image to RAM
-        self.send_data2(image1)
+        self.write_plane(0x10, self._merge_nibbles(high, low, GRAY_OLD_TABLES, size))
+        self.write_plane(0x13, self._merge_nibbles(high, low, GRAY_NEW_TABLES, size))
 
-        self.send_command(0x12)
-        epd_config.delay_ms(100)
-        self.ReadBusy()
+        self._refresh()
 
-    def display_4Gray(self, image):
-        self.send_command(0x10)
-        for i in range(0, 48000):     
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01  
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01 
-                    else: #0x40
-                        temp3 |= 0x00 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01
-                    else :   #0x40
-                        temp3 |= 0x00	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x13)	       
-        for i in range(0, 48000):       
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00
-                    else: #0x40
-                        temp3 |= 0x01 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 
-                    else:    #0x40
-                            temp3 |= 0x01	
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-        
-        self.send_command(0x12)
-        epd_config.delay_ms(100)
-        self.ReadBusy()
+    def _merge_nibbles(self, high, low, tables, size):
+        plane = int.from_bytes(high.translate(tables[0]), 'big') | int.from_bytes(low.translate(tables[1]), 'big')
+        return plane.to_bytes(size, 'big')
 
     def sleep(self):
         self.send_command(0x50)
@@ -446,6 +576,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epd_config.delay_ms(2000)
-        epd_config.module_exit()
+        self.config.delay_ms(2000)
+        self.config.module_exit()
 ### END OF FILE ###
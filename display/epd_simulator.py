@@ -0,0 +1,277 @@
+import logging
+import time
+
+from display.epd_config import RaspberryPi, TransferStats, SPIDEV_DEFAULT_BUFSIZ, DEFAULT_SPI_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Approximate time BUSY stays low after a refresh (0x12), per panel mode, from
+# the 7.5" V2 datasheet figures
+REFRESH_SECONDS = {
+    'full': 5.0,
+    'fast': 1.5,
+    'partial': 0.4,
+    '4gray': 3.0,
+}
+POWER_ON_SECONDS = 0.08
+POWER_OFF_SECONDS = 0.03
+# Fixed cost of one spidev write ioctl when SPI wire time is modelled
+SPI_IOCTL_SECONDS = 20e-6
+
+# Value written to 0xE5 by each init sequence, which tells the modes apart
+E5_MODES = {
+    0x5A: 'fast',
+    0x6E: 'partial',
+    0x5F: '4gray',
+}
+
+
+class SimulatedPanel:
+    """
+    Hardware-free stand-in for RaspberryPi that emulates the 7.5" V2 controller.
+
+    It exposes the same pins and digital_write/digital_read/digital_wait/
+    spi_writebyte/spi_writebyte2/delay_ms surface, decodes the command stream
+    (DC low = command, DC high = parameters) into the two RAM planes, and applies
+    them to `glass` on every 0x12 refresh. BUSY is held low for a modelled time
+    after power-on and each refresh.
+
+    Time is virtual by default: delay_ms and busy waits advance `clock` instead
+    of sleeping, so whole refresh cycles run in milliseconds. With realtime=True
+    they sleep for real, which is what a timing benchmark wants.
+
+    SPI transfers are instantaneous unless spi_hz is given; then each write
+    takes its real wire time at that clock plus a per-ioctl cost, slept for
+    real even with virtual time, so a thread packing data meanwhile overlaps
+    it as it would a blocking spidev write. Above max_spi_hz the simulated
+    wiring flips bits in the data it carries, for exercising calibration.
+
+    Every GPIO write and SPI transfer is appended to `events` as
+    (clock, kind, ...) tuples when record=True, and always counted in `stats`.
+    """
+
+    RST_PIN  = RaspberryPi.RST_PIN
+    DC_PIN   = RaspberryPi.DC_PIN
+    CS_PIN   = RaspberryPi.CS_PIN
+    BUSY_PIN = RaspberryPi.BUSY_PIN
+    PWR_PIN  = RaspberryPi.PWR_PIN
+
+    def __init__(self, width=800, height=480, realtime=False, record=True, spi_hz=None,
+                 max_spi_hz=None):
+        self.width = width
+        self.height = height
+        self.realtime = realtime
+        self.record = record
+        self.spi_hz = spi_hz
+        self.max_spi_hz = max_spi_hz
+
+        self.stats = TransferStats()
+        self.spi_settings = DEFAULT_SPI_SETTINGS
+        self.spi_bufsiz = SPIDEV_DEFAULT_BUFSIZ
+        self.events = []
+        self.clock = 0.0
+
+        self.pins = {self.RST_PIN: 0, self.DC_PIN: 0, self.CS_PIN: 1, self.PWR_PIN: 0}
+        self.busy_until = 0.0
+        self.refreshes = []
+
+        size = width * height // 8
+        self.old_ram = bytearray(size)
+        self.new_ram = bytearray(size)
+        # What the panel shows, as 1-bpp rows in EPD.getbuffer layout (1 = black)
+        self.glass = bytearray(size)
+        # (old, new) planes of the last 4-gray refresh
+        self.gray_planes = None
+
+        self._power_on_reset()
+
+    def _power_on_reset(self):
+        self.mode = 'full'
+        self.asleep = False
+        self.powered = False
+        self.new_inverted = False
+        # Partial window from 0x90 as (first byte column, top row, end byte column, end row)
+        self.window = None
+        self.partial = False
+        self._command = None
+        self._params = bytearray()
+        self._ram = None
+        self._cursor = 0
+
+    # --- backend surface -------------------------------------------------
+
+    def digital_write(self, pin, value):
+        if pin != self.CS_PIN:
+            self.stats.gpio_writes += 1
+        if self.record:
+            self.events.append((self.clock, 'gpio', pin, value))
+        if pin == self.RST_PIN and value and not self.pins.get(pin):
+            # Rising edge on RST: the controller restarts
+            self._power_on_reset()
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin == self.BUSY_PIN:
+            return 0 if self.clock < self.busy_until else 1
+        return self.pins.get(pin, 0)
+
+    def digital_wait(self, pin, value, timeout):
+        if pin == self.BUSY_PIN and value and self.clock < self.busy_until:
+            self._advance(min(self.busy_until - self.clock, timeout))
+        return self.digital_read(pin) == value
+
+    def delay_ms(self, delaytime):
+        self._advance(delaytime / 1000.0)
+
+    def configure_spi(self, settings):
+        self.spi_settings = settings
+        self.spi_bufsiz = settings.chunk_size or SPIDEV_DEFAULT_BUFSIZ
+        if self.spi_hz is not None:
+            self.spi_hz = settings.speed_hz
+
+    def spi_writebyte(self, data):
+        self.stats.spi_calls += 1
+        self._spi(bytes(data), 1)
+
+    def spi_writebyte2(self, data):
+        data = bytes(data)
+        calls = max(1, -(-len(data) // self.spi_bufsiz))
+        self.stats.spi_calls += calls
+        self._spi(data, calls)
+
+    def module_init(self, cleanup=False):
+        self.pins[self.PWR_PIN] = 1
+        return 0
+
+    def module_exit(self, cleanup=False):
+        self.pins[self.RST_PIN] = 0
+        self.pins[self.DC_PIN] = 0
+        self.pins[self.PWR_PIN] = 0
+
+    # --- controller model ------------------------------------------------
+
+    def _advance(self, seconds):
+        if seconds <= 0:
+            return
+        if self.realtime:
+            time.sleep(seconds)
+        self.clock += seconds
+
+    def _spi(self, data, calls):
+        self.stats.spi_bytes += len(data)
+        if self.spi_hz:
+            seconds = len(data) * 8 / self.spi_hz + calls * SPI_IOCTL_SECONDS
+            time.sleep(seconds)
+            self.clock += seconds
+            if self.max_spi_hz and self.spi_hz > self.max_spi_hz:
+                data = bytes(b ^ 0x01 if i % 251 == 7 else b for i, b in enumerate(data))
+        dc = self.pins[self.DC_PIN]
+        if self.record:
+            self.events.append((self.clock, 'spi', dc, data))
+        if self.asleep:
+            return
+        if dc:
+            self._write_data(data)
+        else:
+            for command in data:
+                self._start_command(command)
+
+    def _start_command(self, command):
+        self._command = command
+        self._params = bytearray()
+        self._ram = None
+        if command == 0x10:
+            self._ram, self._cursor = self.old_ram, 0
+        elif command == 0x13:
+            self._ram, self._cursor = self.new_ram, 0
+        elif command == 0x04:
+            self.powered = True
+            self.busy_until = self.clock + POWER_ON_SECONDS
+        elif command == 0x02:
+            self.powered = False
+            self.busy_until = self.clock + POWER_OFF_SECONDS
+        elif command == 0x91:
+            self.partial = True
+        elif command == 0x92:
+            self.partial = False
+        elif command == 0x12:
+            self._refresh()
+
+    def _apply_params(self):
+        # Commands whose effect depends on their parameters are re-applied as
+        # parameter bytes arrive, since the command is only complete once the
+        # next one starts
+        command, params = self._command, self._params
+        if command == 0x50 and params:
+            # VCOM and data interval: DDX=10 means new-data 1 is white
+            self.new_inverted = (params[0] >> 4) & 0x03 == 0x02
+        elif command == 0xE5 and params:
+            self.mode = E5_MODES.get(params[0], self.mode)
+        elif command == 0x90 and len(params) >= 8:
+            self.window = (
+                (params[0] << 8 | params[1]) // 8,
+                params[4] << 8 | params[5],
+                (params[2] << 8 | params[3]) // 8 + 1,
+                (params[6] << 8 | params[7]) + 1,
+            )
+        elif command == 0x07 and params[:1] == b'\xA5':
+            self.asleep = True
+
+    def _write_data(self, data):
+        if self._ram is None:
+            self._params += data
+            self._apply_params()
+            return
+        stride = self.width // 8
+        if self.partial and self.window is not None:
+            # RAM writes fill the partial window row by row
+            first, top, last, bottom = self.window
+            row_bytes = last - first
+            window_size = row_bytes * (bottom - top)
+            pos = 0
+            while pos < len(data):
+                row, col = divmod(self._cursor % window_size, row_bytes)
+                count = min(row_bytes - col, len(data) - pos)
+                start = (top + row) * stride + first + col
+                self._ram[start:start + count] = data[pos:pos + count]
+                self._cursor += count
+                pos += count
+        else:
+            size = len(self._ram)
+            pos = 0
+            while pos < len(data):
+                start = self._cursor % size
+                count = min(size - start, len(data) - pos)
+                self._ram[start:start + count] = data[pos:pos + count]
+                self._cursor += count
+                pos += count
+
+    def _refresh(self):
+        new = self.new_ram.translate(bytes(range(0xFF, -1, -1))) if self.new_inverted else self.new_ram
+        if self.mode == '4gray':
+            self.gray_planes = (bytes(self.old_ram), bytes(self.new_ram))
+        elif self.partial and self.window is not None:
+            first, top, last, bottom = self.window
+            stride = self.width // 8
+            for row in range(top, bottom):
+                start = row * stride
+                self.glass[start + first:start + last] = new[start + first:start + last]
+        else:
+            self.glass[:] = new
+
+        duration = REFRESH_SECONDS[self.mode]
+        self.busy_until = self.clock + duration
+        self.refreshes.append((self.clock, self.mode, self.window if self.partial else None, duration))
+        logger.debug("Simulated %s refresh, busy for %.2fs", self.mode, duration)
+
+    # --- inspection ------------------------------------------------------
+
+    def glass_image(self):
+        """The panel contents as a mode '1' Pillow image"""
+        from PIL import Image
+        return Image.frombytes('1', (self.width, self.height), bytes(self.glass), 'raw', '1;I')
+
+    def reset_log(self):
+        self.events = []
+        self.refreshes = []
+        self.stats = TransferStats()
@@ -0,0 +1,65 @@
+import functools
+import io
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FONT_PATH = Path(__file__).resolve().parent / 'pic' / 'Font.ttc'
+
+# Distinct (font, text) measurements remembered by text_size
+TEXT_SIZE_CACHE_SIZE = 1024
+
+
+class FontRegistry:
+    """
+    Process-wide font faces. Each font file is read once; a FreeTypeFont for a
+    given size is created the first time that size is asked for and shared by
+    every caller after that.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def get(self, size, path=DEFAULT_FONT_PATH) -> 'ImageFont.FreeTypeFont':
+        key = (str(path), size)
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        from PIL import ImageFont
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                data = self._data.get(key[0])
+                if data is None:
+                    data = self._data[key[0]] = Path(path).read_bytes()
+                logger.debug("Loading %s at %dpt", path, size)
+                font = self._fonts[key] = ImageFont.truetype(io.BytesIO(data), size)
+        return font
+
+    def loaded(self):
+        """(path, size) of every font created so far"""
+        return list(self._fonts)
+
+
+FONTS = FontRegistry()
+
+
+@functools.lru_cache(maxsize=TEXT_SIZE_CACHE_SIZE)
+def text_size(font, text):
+    """
+    (width, height) of `text` as ImageDraw.textbbox measures it when drawn at
+    the origin, remembered per (font, text). The font objects come from the
+    registry and live for the whole process, so they are stable cache keys.
+    """
+    left, top, right, bottom = font.getbbox(text, mode='1')
+    return right - left, bottom - top
@@ -0,0 +1,116 @@
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# A refresh decision for one frame. `windows` holds (x_start, y_start, x_end, y_end)
+# pixel rectangles, end-exclusive with x on 8-pixel boundaries; it is empty when
+# the frame is unchanged and ignored when `full` is set.
+RefreshPlan = namedtuple('RefreshPlan', ['full', 'windows'])
+
+
+class FrameDiff:
+    """
+    Compares packed frames against the last one sent to the panel and plans
+    the cheapest refresh that brings the glass up to date.
+
+    Frames are the 1-bpp buffers produced by EPD.getbuffer, so every byte is an
+    8-pixel-aligned column of one row. Changed rows are found by comparing row
+    slices, and the changed byte span inside each row comes from XOR-ing the old
+    and new rows as integers, so no Python loop touches individual bytes.
+    """
+
+    def __init__(self, width, height, full_refresh_ratio=0.4, max_windows=3,
+                 merge_gap=16, full_refresh_every=20):
+        """
+        Args:
+            width, height: Panel size in pixels
+            full_refresh_ratio: Fraction of the panel area above which a full
+                refresh is used instead of partial windows
+            max_windows: Most partial windows per frame; more are merged into one
+            merge_gap: Changed row bands closer than this many rows share a window
+            full_refresh_every: Force a full refresh after this many partial ones
+                to clear ghosting (0 disables)
+        """
+        self.width = width
+        self.height = height
+        self.stride = width // 8
+        self.full_refresh_ratio = full_refresh_ratio
+        self.max_windows = max_windows
+        self.merge_gap = merge_gap
+        self.full_refresh_every = full_refresh_every
+
+        self.last_frame = None
+        self.partial_count = 0
+
+    def seed(self, frame):
+        """Assume `frame` is what the panel currently shows"""
+        self.last_frame = bytes(frame)
+        self.partial_count = 0
+
+    def changed_rows(self, frame):
+        """Yield (row, first_byte, last_byte) for every row that differs from the last frame"""
+        old = memoryview(self.last_frame)
+        new = memoryview(frame)
+        stride = self.stride
+        for row in range(self.height):
+            start = row * stride
+            old_row = old[start:start + stride]
+            new_row = new[start:start + stride]
+            if old_row == new_row:
+                continue
+            delta = int.from_bytes(old_row, 'big') ^ int.from_bytes(new_row, 'big')
+            first = stride - 1 - (delta.bit_length() - 1) // 8
+            last = stride - 1 - ((delta & -delta).bit_length() - 1) // 8
+            yield row, first, last
+
+    def changed_windows(self, frame):
+        """Bounding windows of the changed areas, one per band of nearby changed rows"""
+        bands = []
+        for row, first, last in self.changed_rows(frame):
+            if bands and row - bands[-1][3] <= self.merge_gap:
+                band = bands[-1]
+                band[0] = min(band[0], first)
+                band[2] = max(band[2], last)
+                band[3] = row
+            else:
+                bands.append([first, row, last, row])
+
+        if len(bands) > self.max_windows:
+            bands = [[min(b[0] for b in bands), bands[0][1], max(b[2] for b in bands), bands[-1][3]]]
+
+        return [(first * 8, top, (last + 1) * 8, bottom + 1) for first, top, last, bottom in bands]
+
+    def plan(self, frame):
+        """Decide how to refresh the panel for `frame`"""
+        if self.last_frame is None or len(frame) != len(self.last_frame):
+            return RefreshPlan(True, [])
+
+        windows = self.changed_windows(frame)
+        if not windows:
+            return RefreshPlan(False, [])
+
+        area = sum((x_end - x_start) * (y_end - y_start) for x_start, y_start, x_end, y_end in windows)
+        if area > self.full_refresh_ratio * self.width * self.height:
+            logger.debug("Changed area %d px exceeds threshold, using full refresh", area)
+            return RefreshPlan(True, windows)
+        if self.full_refresh_every and self.partial_count >= self.full_refresh_every:
+            logger.debug("%d partial refreshes since the last full one, using full refresh", self.partial_count)
+            return RefreshPlan(True, windows)
+        return RefreshPlan(False, windows)
+
+    def commit(self, frame, plan):
+        """Record that `frame` has been sent to the panel according to `plan`"""
+        self.last_frame = bytes(frame)
+        if plan.full:
+            self.partial_count = 0
+        elif plan.windows:
+            self.partial_count += 1
+
+    def crop(self, frame, window):
+        """Packed bytes of `window` in `frame`, row by row, as display_Partial expects"""
+        x_start, y_start, x_end, y_end = window
+        first, last = x_start // 8, x_end // 8
+        stride = self.stride
+        view = memoryview(frame)
+        return b''.join(view[row * stride + first:row * stride + last] for row in range(y_start, y_end))
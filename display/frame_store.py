@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import os
+import struct
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# magic, frame length, partial refreshes since the last full one, SHA-256 of the frame
+HEADER = struct.Struct('<4sIH32s')
+MAGIC = b'EPF1'
+
+
+def default_frame_store_path():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_dir) / 'weather-epd' / 'last_frame.bin'
+
+
+class FrameStore:
+    """
+    Persists the last packed frame sent to the panel, so a new process can tell
+    whether the glass already shows what it is about to draw.
+
+    The file is a small header followed by the raw frame. Writes go to a
+    temporary file that is fsync'd and renamed over the old one, so a crash or
+    power cut leaves either the previous frame or the new one, never a mix.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else default_frame_store_path()
+
+    @staticmethod
+    def digest(frame):
+        return hashlib.sha256(frame).digest()
+
+    def load(self):
+        """
+        Returns:
+            (frame, partial_count), or None if there is no valid stored frame
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Could not read last frame from %s: %s", self.path, e)
+            return None
+
+        if len(data) < HEADER.size:
+            return None
+        magic, length, partial_count, digest = HEADER.unpack_from(data)
+        frame = data[HEADER.size:]
+        if magic != MAGIC or len(frame) != length or self.digest(frame) != digest:
+            logger.warning("Ignoring corrupt last frame in %s", self.path)
+            return None
+        return frame, partial_count
+
+    def save(self, frame, partial_count=0):
+        frame = bytes(frame)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, len(frame), min(partial_count, 0xFFFF), self.digest(frame)))
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # The panel has already been refreshed; losing the record only
+            # costs one redundant refresh after the next restart
+            logger.warning("Could not save last frame to %s: %s", self.path, e)
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
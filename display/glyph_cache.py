@@ -0,0 +1,191 @@
+import logging
+import string
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Characters composed from cached glyphs; text with anything else goes to draw.text
+DEFAULT_CHARSET = string.digits + string.ascii_letters + " .,:;-+/%°'"
+
+# Strings with a blank glyph whose draw.text comparison is remembered
+VERIFIED_CACHE_SIZE = 256
+
+# Horizontal corrections tried when measuring a glyph pair
+PAIR_OFFSETS = (0, -1, 1, -2, 2, -3, 3)
+
+
+class FontGlyphs:
+    """
+    1-bit bitmaps and metrics for one font at one size.
+
+    FreeType's hinted layout does not simply add up per-glyph advances:
+    kerning and the hinting deltas move some glyphs by a pixel depending on
+    their neighbour. Rather than re-implement that, each adjacent pair is
+    measured the first time it is needed by rendering it with draw.text and
+    finding the offset at which the cached glyphs reproduce it exactly.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        # char -> (mask, left, top), or None for glyphs without ink
+        self.glyphs = {}
+        self.advances = {}
+        # (left char, right char) -> pixel correction, or None if unmatched
+        self.pairs = {}
+        # text -> whether composing it reproduces draw.text
+        self.verified = OrderedDict()
+
+    def glyph(self, char):
+        if char not in self.advances:
+            from PIL import Image, ImageDraw
+
+            left, top, right, bottom = self.font.getbbox(char, mode='1')
+            if right > left and bottom > top:
+                mask = Image.new('1', (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), char, font=self.font, fill=255)
+                self.glyphs[char] = (mask, left, top)
+            else:
+                self.glyphs[char] = None
+            self.advances[char] = round(self.font.getlength(char, mode='1'))
+        return self.glyphs[char]
+
+    def pair(self, left, right):
+        """Pixel correction between the pen positions of `left` and `right`"""
+        key = (left, right)
+        if key not in self.pairs:
+            if self.glyph(left) is None or self.glyph(right) is None:
+                # Nothing to measure against; take FreeType's kerning as-is
+                length = self.font.getlength
+                self.pairs[key] = round(length(left + right, mode='1') - length(left, mode='1')
+                                        - length(right, mode='1'))
+            else:
+                self.pairs[key] = self._measure_pair(left, right)
+        return self.pairs[key]
+
+    def _measure_pair(self, left, right):
+        from PIL import Image, ImageDraw
+
+        margin = self.font.size * 2
+        size = (self.font.size * 4 + margin * 2, self.font.size * 2 + margin * 2)
+        reference = Image.new('1', size, 255)
+        ImageDraw.Draw(reference).text((margin, margin), left + right, font=self.font, fill=0)
+        reference = reference.tobytes()
+
+        for offset in PAIR_OFFSETS:
+            candidate = Image.new('1', size, 255)
+            self._paste(candidate, left, margin, margin, 0)
+            self._paste(candidate, right, margin + self.advances[left] + offset, margin, 0)
+            if candidate.tobytes() == reference:
+                return offset
+        logger.debug("No glyph offset reproduces %r at %dpt", left + right, self.font.size)
+        return None
+
+    def _paste(self, image, char, x, y, fill):
+        glyph = self.glyph(char)
+        if glyph is not None:
+            mask, left, top = glyph
+            image.paste(fill, (x + left, y + top), mask)
+
+    def compose(self, image, xy, text, fill):
+        """
+        Paste `text` onto `image` with its origin at `xy`.
+
+        Returns:
+            False, without drawing, if a glyph pair could not be matched
+        """
+        x, y = xy
+        pen = 0
+        positions = []
+        for i, char in enumerate(text):
+            self.glyph(char)
+            if i:
+                correction = self.pair(text[i - 1], char)
+                if correction is None:
+                    return False
+                pen += correction
+            positions.append(pen)
+            pen += self.advances[char]
+        for char, pen in zip(text, positions):
+            self._paste(image, char, x + pen, y, fill)
+        return True
+
+    def needs_verification(self, text):
+        # Pairs around a blank glyph were not measured, only taken from kerning
+        return any(self.glyphs[char] is None for char in text)
+
+
+class GlyphCache:
+    """
+    Draws short single-line text by pasting cached 1-bit glyph bitmaps,
+    pixel-identical to ImageDraw.text on mode '1' images.
+
+    Anything the cache cannot vouch for goes to draw.text instead: characters
+    outside the charset, fractional positions, non-1-bit images and
+    strings whose composition did not match draw.text when checked.
+    """
+
+    def __init__(self, charset=DEFAULT_CHARSET):
+        self.charset = frozenset(charset)
+        self._fonts = {}
+        self.composed = 0
+        self.fallbacks = 0
+
+    def glyphs(self, font):
+        font_glyphs = self._fonts.get(font)
+        if font_glyphs is None:
+            font_glyphs = self._fonts[font] = FontGlyphs(font)
+        return font_glyphs
+
+    def text(self, image, draw, xy, text, font, fill=None):
+        """
+        Same result as draw.text(xy, text, font=font, fill=fill), where `draw`
+        draws on `image`
+        """
+        if (image.mode != '1' or not self.charset.issuperset(text)
+                or not all(isinstance(v, int) for v in xy)):
+            return self._fallback(draw, xy, text, font, fill)
+
+        font_glyphs = self.glyphs(font)
+        if not self._verified(font_glyphs, text):
+            return self._fallback(draw, xy, text, font, fill)
+        if not font_glyphs.compose(image, xy, text, draw.ink if fill is None else fill):
+            return self._fallback(draw, xy, text, font, fill)
+        self.composed += 1
+
+    def _verified(self, font_glyphs, text):
+        for char in text:
+            font_glyphs.glyph(char)
+        if not font_glyphs.needs_verification(text):
+            return True
+
+        verdict = font_glyphs.verified.get(text)
+        if verdict is None:
+            verdict = font_glyphs.verified[text] = self._compare(font_glyphs, text)
+            if len(font_glyphs.verified) > VERIFIED_CACHE_SIZE:
+                font_glyphs.verified.popitem(last=False)
+        else:
+            font_glyphs.verified.move_to_end(text)
+        return verdict
+
+    @staticmethod
+    def _compare(font_glyphs, text):
+        from PIL import Image, ImageDraw
+
+        font = font_glyphs.font
+        margin = font.size * 2
+        size = (int(font.getlength(text, mode='1')) + margin * 2, font.size * 2 + margin * 2)
+        reference = Image.new('1', size, 255)
+        ImageDraw.Draw(reference).text((margin, margin), text, font=font, fill=0)
+        candidate = Image.new('1', size, 255)
+        return (font_glyphs.compose(candidate, (margin, margin), text, 0)
+                and candidate.tobytes() == reference.tobytes())
+
+    def _fallback(self, draw, xy, text, font, fill):
+        self.fallbacks += 1
+        draw.text(xy, text, font=font, fill=fill)
+
+    def stats(self):
+        return {'composed': self.composed, 'fallbacks': self.fallbacks}
+
+
+GLYPHS = GlyphCache()
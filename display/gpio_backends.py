@@ -0,0 +1,192 @@
+"""
+GPIO implementations for the panel's control pins (RST, DC, PWR, BUSY).
+
+Each backend claims a pin once and hands back a plain callable bound to it,
+so a DC toggle on the refresh path is one call instead of a dispatch onto a
+pin object:
+
+    write_dc = pins.output(25)      # claim as output, driven low
+    read_busy = pins.input(24)      # claim as input
+    write_dc(1)
+    pins.wait_for(24, 1, timeout)   # block until BUSY reads 1
+
+Backends, by GPIO_BACKENDS name:
+
+    gpiozero  gpiozero LED/Button devices (the original behaviour)
+    lgpio     lgpio straight on the Linux GPIO character device
+    mock      pin levels kept in memory, for benchmarks off the Pi
+
+`python -m display.benchmark --gpio` reports toggles per second for each
+backend that can be created on the machine.
+"""
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GPIO_BACKEND = 'gpiozero'
+
+# Pi 1-4 and Pi 5 on kernels from 6.6.45 expose the header pins as gpiochip0;
+# older Pi 5 kernels put them on gpiochip4
+DEFAULT_GPIOCHIP = 0
+
+
+class GpioZeroPins:
+    def __init__(self):
+        import gpiozero
+
+        self._gpiozero = gpiozero
+        self._devices = {}
+
+    def output(self, pin):
+        led = self._devices[pin] = self._gpiozero.LED(pin)
+        on, off = led.on, led.off
+
+        def write(value):
+            if value:
+                on()
+            else:
+                off()
+        return write
+
+    def input(self, pin, pull_up=False):
+        self._devices[pin] = self._gpiozero.Button(pin, pull_up=pull_up)
+        return self.reader(pin)
+
+    def reader(self, pin):
+        device = self._devices[pin]
+        return lambda: device.value
+
+    def wait_for(self, pin, value, timeout):
+        # gpiozero delivers edges from its pin factory thread, so this sleeps
+        # instead of polling
+        button = self._devices[pin]
+        if value:
+            return button.wait_for_active(timeout)
+        return button.wait_for_inactive(timeout)
+
+    def close(self):
+        for device in self._devices.values():
+            device.close()
+        self._devices.clear()
+
+
+class LgpioPins:
+    def __init__(self, chip=DEFAULT_GPIOCHIP):
+        import lgpio
+
+        self._lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+        self._claimed = []
+        # Input pin -> Event set from lgpio's alert thread on every edge
+        self._edges = {}
+        self._callbacks = []
+
+    def output(self, pin):
+        self._lgpio.gpio_claim_output(self.handle, pin, 0)
+        self._claimed.append(pin)
+        return functools.partial(self._lgpio.gpio_write, self.handle, pin)
+
+    def input(self, pin, pull_up=False):
+        lgpio = self._lgpio
+        flags = lgpio.SET_PULL_UP if pull_up else lgpio.SET_PULL_DOWN
+        # Claimed for alerts, so waits sleep until an edge instead of polling
+        lgpio.gpio_claim_alert(self.handle, pin, lgpio.BOTH_EDGES, flags)
+        self._claimed.append(pin)
+        edge = self._edges[pin] = threading.Event()
+        self._callbacks.append(lgpio.callback(self.handle, pin, lgpio.BOTH_EDGES,
+                                              lambda chip, gpio, level, tick: edge.set()))
+        return self.reader(pin)
+
+    def reader(self, pin):
+        return functools.partial(self._lgpio.gpio_read, self.handle, pin)
+
+    def wait_for(self, pin, value, timeout):
+        read = self.reader(pin)
+        edge = self._edges[pin]
+        deadline = time.monotonic() + timeout
+        while True:
+            # Cleared before reading, so an edge between the read and the
+            # wait still wakes it
+            edge.clear()
+            if read() == value:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            edge.wait(remaining)
+
+    def close(self):
+        for callback in self._callbacks:
+            callback.cancel()
+        self._callbacks.clear()
+        self._edges.clear()
+        for pin in self._claimed:
+            self._lgpio.gpio_free(self.handle, pin)
+        self._claimed.clear()
+        self._lgpio.gpiochip_close(self.handle)
+
+
+class MockPins:
+    """
+    Levels in a dict. Inputs start high, which is BUSY's idle level on this
+    panel, then read whatever set_input() last put there; wait_for never
+    sleeps.
+    """
+
+    def __init__(self):
+        self.levels = {}
+
+    def output(self, pin):
+        self.levels[pin] = 0
+        levels = self.levels
+
+        def write(value):
+            levels[pin] = value
+        return write
+
+    def input(self, pin, pull_up=False):
+        self.levels[pin] = 1
+        return self.reader(pin)
+
+    def reader(self, pin):
+        return functools.partial(self.levels.get, pin, 0)
+
+    def set_input(self, pin, value):
+        self.levels[pin] = value
+
+    def wait_for(self, pin, value, timeout):
+        return self.levels.get(pin, 0) == value
+
+    def close(self):
+        self.levels.clear()
+
+
+GPIO_BACKENDS = {
+    'gpiozero': GpioZeroPins,
+    'lgpio': LgpioPins,
+    'mock': MockPins,
+}
+
+
+def create_gpio(name):
+    try:
+        backend = GPIO_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown GPIO backend {name!r}; choose from {', '.join(GPIO_BACKENDS)}") from None
+    return backend()
+
+
+def measure_toggles(write, toggles=100000):
+    """
+    Returns:
+        Writes per second through the bound callable `write`
+    """
+    start = time.perf_counter()
+    for _ in range(toggles // 2):
+        write(1)
+        write(0)
+    return toggles // 2 * 2 / (time.perf_counter() - start)
+
@@ -0,0 +1,173 @@
+"""
+Packed 1-bpp icon atlas.
+
+All icons, pre-rasterized at the sizes the layouts use, live in one file that
+is memory-mapped at runtime, so drawing an icon is a paste from the map: no
+per-icon file opens, no decoding and no resampling on the device.
+
+Build it offline from the weather-icons SVGs (needs cairosvg) or from raster
+icons such as the BMPs in display/pic:
+
+    python -m display.icon_atlas path/to/weather-icons/svg --sizes 83 \\
+        --out display/pic/icons.atlas
+
+Icons are indexed by file stem ("wi-cloud") and size, the length of their
+longer side in pixels.
+"""
+import argparse
+import io
+import logging
+import mmap
+import struct
+import sys
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# magic, number of icons; followed by the index entries, then the bitmaps
+HEADER = struct.Struct('<4sI')
+# name, size, width, height, offset of the packed rows from the start of the file
+ENTRY = struct.Struct('<48sHHHI')
+MAGIC = b'EPA1'
+
+DEFAULT_ATLAS_PATH = Path(__file__).resolve().parent / 'pic' / 'icons.atlas'
+
+# Icon sizes used by DisplayManager's layout
+LAYOUT_ICON_SIZES = (83,)
+
+RASTER_SUFFIXES = ('.bmp', '.png')
+
+
+class IconAtlas:
+    def __init__(self, path=DEFAULT_ATLAS_PATH):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not an icon atlas: {self.path}")
+        self.index = {}
+        for i in range(count):
+            name, size, width, height, offset = ENTRY.unpack_from(self._map, HEADER.size + i * ENTRY.size)
+            self.index[(name.rstrip(b'\0').decode(), size)] = (width, height, offset)
+
+    @classmethod
+    def open_default(cls):
+        """The bundled atlas, or None if it has not been built"""
+        if not DEFAULT_ATLAS_PATH.exists():
+            return None
+        return cls(DEFAULT_ATLAS_PATH)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, name, size):
+        """
+        Returns:
+            Icon `name` at `size` as a mode '1' image
+        """
+        from PIL import Image
+
+        width, height, offset = self.index[(name, size)]
+        length = (width + 7) // 8 * height
+        return Image.frombuffer('1', (width, height), self._map[offset:offset + length], 'raw', '1', 0, 1)
+
+    def paste(self, image, name, size, position=(0, 0)):
+        image.paste(self.get(name, size), position)
+
+    def close(self):
+        self._map.close()
+
+
+def rasterize(path, size):
+    """Render one icon so its longer side is `size` pixels, as a mode '1' image"""
+    from PIL import Image
+
+    path = Path(path)
+    if path.suffix.lower() == '.svg':
+        try:
+            import cairosvg
+        except ImportError:
+            raise SystemExit("Rasterizing SVG icons needs cairosvg: pip install cairosvg")
+        png = cairosvg.svg2png(url=str(path), output_width=size, output_height=size)
+        with Image.open(io.BytesIO(png)) as rendered:
+            # The SVGs are black glyphs on a transparent background
+            flat = Image.new('RGBA', rendered.size, (255, 255, 255, 255))
+            flat.alpha_composite(rendered.convert('RGBA'))
+        return flat.convert('L').point(lambda v: 255 if v >= 128 else 0, '1')
+
+    # Same resampling as DisplayManager.scale_and_display_bmp, so the atlas
+    # matches what the layout drew from the BMPs before
+    with Image.open(path) as original:
+        width, height = original.size
+        scale = size / max(width, height)
+        new_size = (round(width * scale), round(height * scale))
+        icon = original.resize(new_size, Image.LANCZOS) if new_size != original.size else original.copy()
+    return icon if icon.mode == '1' else icon.convert('1')
+
+
+def build_atlas(sources, sizes, out_path):
+    """
+    Args:
+        sources: Icon files (.svg, .bmp, .png)
+        sizes: Sizes, in pixels of the longer side, to rasterize every icon at
+        out_path: Atlas file to write
+
+    Returns:
+        Number of icons in the atlas
+    """
+    entries = []
+    bitmaps = []
+    offset = HEADER.size + ENTRY.size * len(sources) * len(sizes)
+    for source in sources:
+        name = Path(source).stem
+        if len(name.encode()) > ENTRY.size - 10:
+            raise ValueError(f"Icon name too long for the atlas index: {name}")
+        for size in sizes:
+            icon = rasterize(source, size)
+            packed = icon.tobytes()
+            entries.append(ENTRY.pack(name.encode(), size, icon.width, icon.height, offset))
+            bitmaps.append(packed)
+            offset += len(packed)
+            logger.info("%s @ %dpx: %dx%d", name, size, icon.width, icon.height)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        f.writelines(entries)
+        f.writelines(bitmaps)
+    tmp_path.replace(out_path)
+    return len(entries)
+
+
+def collect_sources(paths):
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources.extend(sorted(p for p in path.iterdir()
+                                  if p.suffix.lower() in RASTER_SUFFIXES + ('.svg',)))
+        else:
+            sources.append(path)
+    return sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the packed 1-bpp icon atlas")
+    parser.add_argument("sources", nargs='+', help="Icon files or directories of .svg/.bmp/.png icons")
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(LAYOUT_ICON_SIZES),
+                        help="Pixel sizes of the longer side to rasterize at")
+    parser.add_argument("--out", default=str(DEFAULT_ATLAS_PATH), help="Atlas file to write")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    count = build_atlas(collect_sources(args.sources), args.sizes, args.out)
+    print(f"Wrote {count} icons to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
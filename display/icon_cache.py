@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import struct
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# magic, width, height; followed by the icon as packed 1-bit rows
+HEADER = struct.Struct('<4sHH')
+MAGIC = b'ICN1'
+
+
+def default_icon_cache_dir():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_dir) / 'weather-epd' / 'icons'
+
+
+class IconCache:
+    """
+    Ready-to-paste 1-bit icons, keyed by (path, mtime, scale_factor, inverted).
+
+    Icons live in a bounded in-memory LRU backed by a directory of pre-scaled
+    packed bitmaps, so an icon is decoded and resampled once; later processes
+    only read its packed bytes back, and the same process not even that.
+    Editing the source file changes its mtime and therefore its key.
+    """
+
+    def __init__(self, cache_dir=None, capacity=32):
+        """
+        Args:
+            cache_dir: Directory for the packed bitmaps, or False for memory only
+            capacity: Number of icons kept in memory
+        """
+        if cache_dir is False:
+            self.cache_dir = None
+        else:
+            self.cache_dir = Path(cache_dir) if cache_dir is not None else default_icon_cache_dir()
+        self.capacity = capacity
+        self._icons = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, path, scale_factor=1.0, inverted=False):
+        """
+        Returns:
+            The icon at `path` scaled by `scale_factor` as a mode '1' image
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"BMP file not found: {path}") from None
+
+        key = (str(path), mtime, scale_factor, inverted)
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+            self.hits += 1
+            return icon
+
+        icon = self._load_packed(key)
+        if icon is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            icon = self._render(path, scale_factor, inverted)
+            self._save_packed(key, icon)
+
+        self._icons[key] = icon
+        if len(self._icons) > self.capacity:
+            self._icons.popitem(last=False)
+        return icon
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'size': len(self._icons)}
+
+    def clear(self):
+        """Drop the in-memory icons; the packed bitmaps on disk are kept"""
+        self._icons.clear()
+
+    @staticmethod
+    def _render(path, scale_factor, inverted):
+        from PIL import Image, ImageChops
+
+        with Image.open(path) as original_image:
+            width, height = original_image.size
+            new_width = int(width * scale_factor)
+            new_height = int(height * scale_factor)
+
+            # Scale the image using high-quality resampling
+            if scale_factor != 1.0:
+                icon = original_image.resize((new_width, new_height), Image.LANCZOS)
+            else:
+                icon = original_image.copy()
+
+        # Convert to 1-bit mode for e-ink display if needed
+        if icon.mode != '1':
+            icon = icon.convert('1')
+        if inverted:
+            icon = ImageChops.invert(icon)
+        return icon
+
+    def _packed_path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return self.cache_dir / f"{name}.icn"
+
+    def _load_packed(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._packed_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Could not read cached icon %s: %s", path, e)
+            return None
+
+        if len(data) < HEADER.size:
+            return None
+        magic, width, height = HEADER.unpack_from(data)
+        packed = data[HEADER.size:]
+        if magic != MAGIC or len(packed) != (width + 7) // 8 * height:
+            logger.warning("Ignoring corrupt cached icon %s", path)
+            return None
+
+        from PIL import Image
+        return Image.frombytes('1', (width, height), packed)
+
+    def _save_packed(self, key, icon):
+        if self.cache_dir is None:
+            return
+        path = self._packed_path(key)
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, *icon.size))
+                f.write(icon.tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The cache is an optimization; a read-only or full disk only costs speed
+            logger.warning("Could not cache icon in %s: %s", path, e)
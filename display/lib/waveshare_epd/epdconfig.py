@@ -162,7 +162,20 @@ class RaspberryPi:
             self.GPIO_BUSY_PIN.close()
 
 
-implementation = RaspberryPi()
-
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
\ No newline at end of file
+implementation = None
+
+def __getattr__(name):
+    # Module-level attributes (RST_PIN, digital_write, ...) resolve against a
+    # RaspberryPi created on first access, so importing this module neither
+    # imports spidev/gpiozero nor claims any pins.
+    global implementation
+    if name.startswith('_'):
+        raise AttributeError(name)
+    if implementation is None:
+        implementation = RaspberryPi()
+        for func in [x for x in dir(implementation) if not x.startswith('_')]:
+            setattr(sys.modules[__name__], func, getattr(implementation, func))
+    try:
+        return getattr(implementation, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
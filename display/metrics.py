@@ -0,0 +1,156 @@
+"""
+Lightweight per-phase timing for the refresh path.
+
+Code wraps each phase in `metrics.span(name)`; finished spans land in an
+in-process ring buffer and in running per-phase totals, which flush() exports
+as JSON lines and as a Prometheus textfile-collector file.
+
+Metrics are off unless enabled, in which case span() hands back one shared
+no-op object, so instrumented code pays a method call and nothing else. The
+process-wide METRICS instance is configured from the environment:
+
+    WEATHER_EPD_METRICS_JSONL  append finished spans to this JSON lines file
+    WEATHER_EPD_METRICS_PROM   write a Prometheus textfile to this path
+"""
+import functools
+import json
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = 'weather_epd'
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **fields):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('metrics', 'phase', 'fields', 'start')
+
+    def __init__(self, metrics, phase, fields):
+        self.metrics = metrics
+        self.phase = phase
+        self.fields = fields
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.phase, time.perf_counter() - self.start, **self.fields)
+        return False
+
+    def add(self, **fields):
+        """Attach extra numbers (e.g. bytes=...) to the span before it finishes"""
+        self.fields.update(fields)
+
+
+class Metrics:
+    def __init__(self, enabled=False, capacity=2048, jsonl_path=None, prom_path=None):
+        self.enabled = enabled
+        self.records = deque(maxlen=capacity)
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        # phase -> [count, total seconds, last seconds, total bytes]
+        self.totals = {}
+        self._exported = 0
+        self._recorded = 0
+
+    @classmethod
+    def from_env(cls):
+        jsonl_path = os.environ.get('WEATHER_EPD_METRICS_JSONL')
+        prom_path = os.environ.get('WEATHER_EPD_METRICS_PROM')
+        return cls(enabled=bool(jsonl_path or prom_path), jsonl_path=jsonl_path, prom_path=prom_path)
+
+    def span(self, phase, **fields):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, phase, fields)
+
+    def record(self, phase, seconds, **fields):
+        if not self.enabled:
+            return
+        entry = {'ts': time.time(), 'phase': phase, 'seconds': seconds}
+        entry.update(fields)
+        self.records.append(entry)
+        self._recorded += 1
+
+        totals = self.totals.setdefault(phase, [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = seconds
+        totals[3] += fields.get('bytes', 0)
+
+    def export_jsonl(self, path):
+        """Append the spans recorded since the last export"""
+        pending = min(self._recorded - self._exported, len(self.records))
+        if pending:
+            with open(path, 'a') as f:
+                for entry in list(self.records)[-pending:]:
+                    f.write(json.dumps(entry) + '\n')
+        self._exported = self._recorded
+
+    def prometheus_text(self):
+        lines = []
+        metrics = (
+            ('phase_runs_total', 'counter', 'Completed spans per refresh phase', 0),
+            ('phase_seconds_total', 'counter', 'Time spent per refresh phase', 1),
+            ('phase_last_seconds', 'gauge', 'Duration of the most recent span per phase', 2),
+            ('phase_bytes_total', 'counter', 'Bytes transferred per refresh phase', 3),
+        )
+        for name, kind, help_text, index in metrics:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for phase, totals in sorted(self.totals.items()):
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{phase="{phase}"}} {totals[index]}')
+        return '\n'.join(lines) + '\n'
+
+    def export_prometheus(self, path):
+        # The textfile collector may read at any time, so replace the file atomically
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Export to whichever of the configured files are set"""
+        if not self.enabled:
+            return
+        try:
+            if self.jsonl_path:
+                self.export_jsonl(self.jsonl_path)
+            if self.prom_path:
+                self.export_prometheus(self.prom_path)
+        except OSError as e:
+            logger.warning("Could not export metrics: %s", e)
+
+
+def timed(phase):
+    """Method decorator: run the method inside self.metrics.span(phase)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.span(phase):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+METRICS = Metrics.from_env()
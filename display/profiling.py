@@ -0,0 +1,125 @@
+"""
+On-demand profiling of refresh cycles.
+
+A CycleProfiler wraps each refresh cycle; every Nth cycle it runs cProfile and
+a wall-clock stack sampler side by side and writes, per profiled cycle:
+
+    <dir>/cycle-<n>-<timestamp>.pstats     for pstats / snakeviz
+    <dir>/cycle-<n>-<timestamp>.collapsed  folded stacks for flamegraph.pl / speedscope
+
+The cycle counter is kept in <dir>/cycle_count so "every Nth refresh" also
+holds for one-shot runs started by cron or a systemd timer.
+"""
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded-stack counts"""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CycleProfiler:
+    def __init__(self, output_dir, every=1, sample_interval=0.005):
+        """
+        Args:
+            output_dir: Directory for the profile files and the cycle counter
+            every: Profile one cycle out of this many
+            sample_interval: Seconds between stack samples
+        """
+        self.output_dir = Path(output_dir)
+        self.every = max(1, every)
+        self.sample_interval = sample_interval
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a profiler from WEATHER_EPD_PROFILE (enable), WEATHER_EPD_PROFILE_DIR
+        and WEATHER_EPD_PROFILE_EVERY, or return None when profiling is off
+        """
+        if not os.environ.get('WEATHER_EPD_PROFILE'):
+            return None
+        return cls(os.environ.get('WEATHER_EPD_PROFILE_DIR', 'profiles'),
+                   every=int(os.environ.get('WEATHER_EPD_PROFILE_EVERY', '1')))
+
+    def _next_cycle(self):
+        counter_path = self.output_dir / 'cycle_count'
+        try:
+            count = int(counter_path.read_text()) + 1
+        except (OSError, ValueError):
+            count = 1
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        counter_path.write_text(str(count))
+        return count
+
+    @contextlib.contextmanager
+    def cycle(self):
+        """Context manager around one refresh cycle; profiles it if it is due"""
+        count = self._next_cycle()
+        if count % self.every:
+            yield
+            return
+
+        import cProfile
+        profile = cProfile.Profile()
+        sampler = StackSampler(self.sample_interval)
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            stem = self.output_dir / f"cycle-{count}-{time.strftime('%Y%m%d_%H%M%S')}"
+            profile.dump_stats(f"{stem}.pstats")
+            sampler.write_collapsed(f"{stem}.collapsed")
+            logger.info("Profile for cycle %d written to %s.{pstats,collapsed}", count, stem)
+
+
+def profile_cycle(profiler):
+    """profiler.cycle() if a profiler is configured, else a no-op context"""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.cycle()
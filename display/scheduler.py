@@ -0,0 +1,73 @@
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """
+    Calls a function on a fixed schedule aligned to the wall clock, e.g. every
+    300 s means at :00, :05, :10 past the hour, until stop() is called.
+
+    Every wake-up target is computed from the wall clock rather than by adding
+    the interval to the previous one, so slow cycles and oversleeping never
+    accumulate drift; a cycle that overruns its slot skips to the next one.
+    """
+
+    # Longest single sleep, so wall-clock jumps (NTP sync at boot) are noticed
+    MAX_SLEEP = 30.0
+
+    def __init__(self, interval, offset=0.0):
+        """
+        Args:
+            interval: Seconds between refreshes
+            offset: Seconds after each aligned boundary to run at
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.offset = offset
+        self._stop = threading.Event()
+
+    def next_run(self, now):
+        """The first aligned slot strictly after `now` (seconds since the epoch)"""
+        slots = math.floor((now - self.offset) / self.interval) + 1
+        return slots * self.interval + self.offset
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def wait_until(self, target):
+        """Sleep until wall-clock `target`; returns False if stopped first"""
+        while not self._stop.is_set():
+            remaining = target - time.time()
+            if remaining <= 0:
+                return True
+            self._stop.wait(min(remaining, self.MAX_SLEEP))
+        return False
+
+    def run(self, func, run_now=True):
+        """
+        Call func() on every slot until stopped.
+
+        Args:
+            func: Zero-argument callable for one refresh cycle
+            run_now: Also run once immediately instead of waiting for the first slot
+        """
+        if run_now and not self._stop.is_set():
+            func()
+        while not self._stop.is_set():
+            target = self.next_run(time.time())
+            logger.debug("Next refresh at %s", time.strftime('%H:%M:%S', time.localtime(target)))
+            if not self.wait_until(target):
+                break
+            lateness = time.time() - target
+            if lateness > 1.0:
+                logger.warning("Refresh started %.1fs late", lateness)
+            func()
@@ -15,54 +15,18 @@ logging.basicConfig(level=logging.DEBUG)
 
 def save_display_preview(image, filename=None, scale=2):
     """
-    Save a preview of the e-ink display content to a file and optionally open it.
+    Save a preview of the e-ink display content to a file.
     
     Args:
         image: PIL Image object containing the display content
         filename: Path where to save the preview (default: creates a timestamped file)
-        preview: If True, tries to open the image in the default viewer
         scale: Scale factor to make the preview larger and more visible (default: 2)
     
     Returns:
         Path to the saved preview file
     """
-    import os
-    import datetime
-    import subprocess
-    from PIL import Image, ImageOps
-    
-    if filename is None:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"eink_preview_{timestamp}.png"
-    
-    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
-    
-    # Create a copy of the image to avoid modifying the original
-    preview_image = image.copy()
-    
-    # Convert to RGB to better simulate e-ink appearance
-    if preview_image.mode == '1':
-        # For 1-bit images, convert to RGB with proper black and white
-        preview_image = preview_image.convert('RGB')
-        
-        # Optional: Add slight gray tinting to simulate e-ink appearance
-        pixels = preview_image.load()
-        width, height = preview_image.size
-        for x in range(width):
-            for y in range(height):
-                r, g, b = pixels[x, y]
-                if r > 200 and g > 200 and b > 200:  # If it's close to white
-                    pixels[x, y] = (245, 245, 240)  # Slight off-white for e-ink simulation
-    
-    # Scale up for better visibility
-    if scale != 1:
-        width, height = preview_image.size
-        preview_image = preview_image.resize((width * scale, height * scale), Image.LANCZOS)
-    
-    preview_image.save(filename)
-    print(f"Preview saved to: {filename}")
-    
-    return filename
+    from display.display_manager import save_preview
+    return save_preview(image, filename, scale)
 
 def scale_and_display_bmp(epd, bmp_path, position=(0, 0), scale_factor=1.0, 
                           inverted=False, base_image=None, update_display=True):
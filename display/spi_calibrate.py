@@ -0,0 +1,189 @@
+"""
+Find the fastest SPI settings the panel runs reliably at and save them as
+the profile RaspberryPi loads on startup.
+
+    sudo python -m display.spi_calibrate --confirm
+    python -m display.spi_calibrate --simulate --max-stable-hz 16000000
+
+Every (clock, chunk size) pair draws a test pattern --repeat times with a
+full refresh, timing the two plane transfers. A pair is stable when every
+refresh held BUSY for a real refresh and the pattern arrived intact: on
+hardware as confirmed by eye with --confirm, on the simulator by comparing
+the glass with the pattern. The stable pair with the shortest median
+transfer time is saved.
+
+A garbled transfer still produces a refresh of normal length, so BUSY timing
+says nothing about the data. Without --confirm on hardware the run is a dry
+run: it reports timings but never saves a profile.
+
+Clocks are swept upwards and the sweep stops at the first clock at which no
+chunk size is stable. Chunk sizes above spidev's bufsiz module parameter are
+skipped; raise it (spidev.bufsiz=65536 in cmdline.txt) to try them.
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+
+from display.epd_config import SpiSettings, DEFAULT_SPI_SETTINGS, default_spi_profile_path, save_spi_profile
+from display.epd_interface import EPD
+from display.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPEEDS = (2000000, 4000000, 8000000, 10000000, 16000000, 20000000, 32000000)
+DEFAULT_CHUNKS = (1024, 2048, 4096, 8192, 16384, 65536)
+
+# A full refresh keeps BUSY low for seconds; much less means it never happened
+MIN_REFRESH_SECONDS = 1.0
+
+
+def test_pattern(epd):
+    """A packed frame of alternating bits with solid bands, stressing every bit of the link"""
+    row_bytes = epd.width // 8
+    rows = []
+    for y in range(epd.height):
+        if (y // 40) % 3 == 2:
+            rows.append(bytes([0xFF if (y // 40) % 2 else 0x00]) * row_bytes)
+        else:
+            rows.append(bytes([0x55 if y % 2 else 0xAA]) * row_bytes)
+    return b''.join(rows)
+
+
+class Calibrator:
+    def __init__(self, config, repeat=2, confirm=False):
+        self.config = config
+        self.metrics = Metrics(enabled=True)
+        self.epd = EPD(config, self.metrics)
+        self.repeat = repeat
+        self.confirm = confirm
+        self.frame = test_pattern(self.epd)
+
+    def transfer_seconds(self):
+        return sum(self.metrics.totals[phase][2] for phase in ('transfer_0x10', 'transfer_0x13'))
+
+    @property
+    def checks_frames(self):
+        """Whether frame_intact() compares the frame itself rather than just BUSY timing"""
+        return self.confirm or getattr(self.config, 'glass', None) is not None
+
+    def frame_intact(self):
+        glass = getattr(self.config, 'glass', None)
+        if glass is not None:
+            # Simulator: compare what reached the panel
+            return bytes(glass) == self.frame
+        if self.epd.last_busy_time < MIN_REFRESH_SECONDS:
+            logger.info("Refresh finished after %.2fs, too soon to be real", self.epd.last_busy_time)
+            return False
+        if self.confirm:
+            answer = input("Does the panel show even fine stripes with solid bands? [y/N] ")
+            return answer.strip().lower().startswith('y')
+        return True
+
+    def trial(self, settings):
+        """
+        Returns:
+            Median seconds to transfer both planes, or None if unstable
+        """
+        self.config.configure_spi(settings)
+        timings = []
+        try:
+            # A garbled earlier trial can leave the controller in any state.
+            # The SPI device stays open across trials; configure_spi has
+            # already applied the new settings to it.
+            if self.epd.init() != 0:
+                return None
+            for _ in range(self.repeat):
+                self.epd.display(self.frame)
+                timings.append(self.transfer_seconds())
+                if not self.frame_intact():
+                    return None
+        except (TimeoutError, OSError) as e:
+            logger.info("%s failed: %s", settings, e)
+            return None
+        return statistics.median(timings)
+
+    def run(self, speeds, chunks):
+        """
+        Returns:
+            ([(SpiSettings, median seconds or None), ...], fastest stable SpiSettings or None)
+        """
+        kernel_bufsiz = getattr(self.config, 'kernel_bufsiz', None)
+        if kernel_bufsiz:
+            usable = [c for c in chunks if c <= kernel_bufsiz]
+            if len(usable) < len(chunks):
+                logger.info("Skipping chunk sizes above spidev bufsiz %d", kernel_bufsiz)
+            chunks = usable
+
+        results = []
+        for speed in sorted(speeds):
+            stable_at_speed = False
+            for chunk in chunks:
+                settings = SpiSettings(speed, DEFAULT_SPI_SETTINGS.mode, chunk)
+                seconds = self.trial(settings)
+                results.append((settings, seconds))
+                print(f"{speed / 1e6:6.1f} MHz  chunk {chunk:6d}  "
+                      + (f"{seconds * 1000:8.1f} ms" if seconds is not None else "  unstable"))
+                stable_at_speed = stable_at_speed or seconds is not None
+            if not stable_at_speed:
+                break
+
+        stable = [(seconds, settings) for settings, seconds in results if seconds is not None]
+        best = min(stable)[1] if stable else None
+        self.epd.sleep()
+        return results, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the panel's SPI clock and chunk size")
+    parser.add_argument("--speeds", type=int, nargs='+', default=list(DEFAULT_SPEEDS), metavar='HZ',
+                        help="SPI clocks to try")
+    parser.add_argument("--chunks", type=int, nargs='+', default=list(DEFAULT_CHUNKS), metavar='BYTES',
+                        help="Write chunk sizes to try")
+    parser.add_argument("--repeat", type=int, default=2, help="Refreshes per setting")
+    parser.add_argument("--confirm", action="store_true",
+                        help="Ask for a visual check of the test pattern after every refresh")
+    parser.add_argument("--profile", default=None,
+                        help=f"Profile to write (default: {default_spi_profile_path()})")
+    parser.add_argument("--dry-run", action="store_true", help="Report the best setting without saving it")
+    parser.add_argument("--simulate", action="store_true",
+                        help="Calibrate against the simulated panel instead of the hardware")
+    parser.add_argument("--max-stable-hz", type=int, default=None,
+                        help="With --simulate, corrupt transfers above this clock")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.simulate:
+        from display.epd_simulator import SimulatedPanel
+        config = SimulatedPanel(record=False, spi_hz=DEFAULT_SPI_SETTINGS.speed_hz,
+                                max_spi_hz=args.max_stable_hz)
+    else:
+        from display.epd_config import RaspberryPi
+        config = RaspberryPi(DEFAULT_SPI_SETTINGS)
+
+    calibrator = Calibrator(config, args.repeat, args.confirm)
+    dry_run = args.dry_run
+    if not calibrator.checks_frames and not dry_run:
+        logger.warning("Without --confirm nothing checks the frames on the panel; "
+                       "reporting timings only, no profile will be saved")
+        dry_run = True
+
+    started = time.time()
+    results, best = calibrator.run(args.speeds, args.chunks)
+    if best is None:
+        print("No stable setting found; keeping the current profile")
+        return 1
+
+    seconds = dict(results)[best]
+    print(f"Fastest stable: {best.speed_hz / 1e6:g} MHz, chunk {best.chunk_size} bytes, "
+          f"{seconds * 1000:.1f} ms per frame")
+    if not dry_run:
+        path = save_spi_profile(best, args.profile, transfer_ms=round(seconds * 1000, 2),
+                                calibrated=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)))
+        print(f"Profile saved to: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
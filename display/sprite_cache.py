@@ -0,0 +1,54 @@
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SpriteCache:
+    """
+    Bounded LRU of rendered 1-bit sprites.
+
+    A sprite is the ink of some drawing code, cropped to its bounding box,
+    together with the canvas position of that box. Pasting it with the
+    original colour as the fill reproduces the drawing exactly, so repeated
+    shapes cost one paste instead of a round of ImageDraw calls.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, canvas_size, render):
+        """
+        Args:
+            key: Hashable description of everything that affects the drawing
+            canvas_size: Size of the image the drawing is meant for
+            render: Called with an ImageDraw to draw with fill/outline 255
+
+        Returns:
+            (mask, (x, y)), or None if the drawing has no ink on the canvas
+        """
+        if key in self._sprites:
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return self._sprites[key]
+
+        from PIL import Image, ImageDraw
+
+        self.misses += 1
+        # Drawn at its real coordinates: the float geometry does not round the
+        # same way once translated, so a shifted render would not be identical
+        canvas = Image.new('1', canvas_size, 0)
+        render(ImageDraw.Draw(canvas))
+        box = canvas.getbbox()
+        sprite = (canvas.crop(box), box[:2]) if box is not None else None
+
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.capacity:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._sprites)}
@@ -1,13 +1,73 @@
 import argparse
 import logging
+import signal
+import time
 
 from display.display_manager import DisplayManager
+from display.epd_config import BACKENDS, create_backend
+from display.profiling import CycleProfiler, profile_cycle
+from display.scheduler import RefreshScheduler
 
-def main(dev_mode: bool):
+logger = logging.getLogger(__name__)
+
+def hardware_backend(dev_mode: bool, backend: str = None):
+    # Dev mode never touches the panel, so no pins are claimed for it
+    if dev_mode or backend is None:
+        return None
+    return create_backend(backend)
+
+def main(dev_mode: bool, profiler: CycleProfiler = None, preview_path: str = None, backend: str = None):
     print(f"--dev-mode: {dev_mode}")
 
-    display_manager = DisplayManager(dev_mode=dev_mode)
-    display_manager.render_display()
+    with profile_cycle(profiler):
+        display_manager = DisplayManager(dev_mode=dev_mode, epd_backend=hardware_backend(dev_mode, backend))
+        if preview_path:
+            display_manager.preview_path = preview_path
+        # Held after the profiled block, so profiles show the refresh rather than the sleep
+        post_refresh_delay, display_manager.post_refresh_delay = display_manager.post_refresh_delay, 0
+        refreshed = display_manager.render_display()
+
+    if refreshed:
+        time.sleep(post_refresh_delay)
+
+def run_daemon(dev_mode: bool, interval: float, offset: float = 0.0, profiler: CycleProfiler = None,
+               preview_path: str = None, backend: str = None):
+    """
+    Keep one DisplayManager (fonts, assets, initialized panel) alive and refresh
+    on a wall-clock schedule until SIGINT/SIGTERM.
+    """
+    print(f"--dev-mode: {dev_mode}, refreshing every {interval:g}s")
+
+    display_manager = DisplayManager(dev_mode=dev_mode, epd_backend=hardware_backend(dev_mode, backend))
+    # The scheduler paces refreshes; no need to hold after each one
+    display_manager.post_refresh_delay = 0
+    if preview_path:
+        display_manager.preview_path = preview_path
+    scheduler = RefreshScheduler(interval, offset)
+
+    def handle_signal(signum, frame):
+        logger.info("Received signal %d, shutting down", signum)
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def refresh():
+        try:
+            with profile_cycle(profiler):
+                display_manager.render_display()
+        except Exception:
+            # One failed cycle (panel stuck busy, SPI error, bad data) must not
+            # end the daemon. The panel state is unknown, so the next cycle
+            # starts with a fresh init, and since the frame was not committed
+            # it is drawn again in full.
+            logger.exception("Refresh failed; retrying at the next slot")
+            display_manager.epd_mode = None
+
+    try:
+        scheduler.run(refresh)
+    finally:
+        display_manager.shutdown()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Main application entry point")
@@ -17,6 +77,65 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable development mode"
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and refresh on a schedule instead of once"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=300,
+        metavar="SECONDS",
+        help="Daemon refresh interval, aligned to the wall clock (default: 300)"
+    )
+    parser.add_argument(
+        "--offset",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="Run each daemon refresh this long after the aligned boundary (default: 0)"
+    )
+    parser.add_argument(
+        "--preview",
+        metavar="PATH",
+        help="Dev mode preview file; .pbm or .bin write raw 1-bit data instead of a PNG "
+             "(default: weather_preview.png)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        help="Panel SPI/GPIO implementation: spidev with gpiozero, or Waveshare's "
+             "DEV_Config library (default: $WEATHER_EPD_BACKEND or spidev)"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile and collapsed-stack profiles of the refresh "
+             "(also enabled by WEATHER_EPD_PROFILE=1)"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default="profiles",
+        help="Directory for profile output (default: profiles)"
+    )
+    parser.add_argument(
+        "--profile-every",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Only profile every Nth refresh (default: 1)"
+    )
     args = parser.parse_args()
 
-    main(dev_mode=args.dev_mode)
+    if args.profile:
+        profiler = CycleProfiler(args.profile_dir, every=args.profile_every)
+    else:
+        profiler = CycleProfiler.from_env()
+
+    if args.daemon:
+        logging.basicConfig(level=logging.INFO)
+        run_daemon(dev_mode=args.dev_mode, interval=args.interval, offset=args.offset, profiler=profiler,
+                   preview_path=args.preview, backend=args.backend)
+    else:
+        main(dev_mode=args.dev_mode, profiler=profiler, preview_path=args.preview, backend=args.backend)